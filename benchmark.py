@@ -0,0 +1,208 @@
+import argparse
+import copy
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import folium
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+import commute
+import data_prep
+import density
+import geometry
+import health
+import point_maps
+import region_index
+import routing
+import scoring
+import spatial_index
+
+# Viewports of the folium maps each section draws: (dataset, center, zoom, tooltip fields, icon column)
+map_center = [34.0522, -118.2437]
+outlet_map = ('FastFoodRestaurants.csv', [39.5, -98.35], 4, (("Name", "name"), ("Address", "address")), None)
+food_map = ('cal.csv', map_center, 11, (("Name", "name"), ("Address", "address")), None)
+fitness_map = ('fitness_grocery.csv', map_center, 12, (("Name", "name"), ("Address", "address"), ("Type", "Type")), "Type")
+section_maps = {
+    'Food Locator': [outlet_map, food_map],
+    'Best Place to Live': [food_map, fitness_map],
+}
+
+
+# Repeat a point dataset `scale` times, jittering the copies by ~1 km so they stay distinct points
+def scale_points(df, scale, seed=0):
+    if scale == 1:
+        return df
+    rng = np.random.default_rng(seed)
+    scaled = df.loc[df.index.repeat(scale)].reset_index(drop=True)
+    jitter = rng.normal(0, 0.01, (len(scaled), 2))
+    jitter[::scale] = 0  # keep the original points in place
+    scaled['latitude'] = scaled['latitude'].astype(float) + jitter[:, 0]
+    scaled['longitude'] = scaled['longitude'].astype(float) + jitter[:, 1]
+    return scaled
+
+
+# Run fn `repeat` times and record its timings under (stage, scale)
+def time_stage(results, stage, scale, rows, fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    result = {
+        'stage': stage,
+        'scale': scale,
+        'rows': rows,
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+    results.append(result)
+    print(f"{stage:<40} x{scale:<4} {rows:>9} rows  {result['median_ms']:>10.2f} ms", file=sys.stderr)
+    return result
+
+
+# Build a section's folium maps for the default viewport and render them to HTML, as st_folium would
+def build_section_maps(maps, datasets):
+    html = []
+    for csv_path, center, zoom, tooltip_fields, icon_column in maps:
+        bounds = point_maps.query_bounds(point_maps.viewport_bounds(center, zoom, 800, 600), zoom)
+        layer_data = point_maps.viewport_layer_data(datasets[csv_path], zoom, bounds, tooltip_fields, icon_column)
+        base_map = folium.Map(location=center, zoom_start=zoom)
+        point_maps.build_point_layer(layer_data, {}).add_to(base_map)
+        html.append(base_map.get_root().render())
+    return html
+
+
+# Query the nearest places around the default starting point and render them, as the route planner does
+def build_nearby_map(place_indexes):
+    places = spatial_index.nearby_places(place_indexes, *map_center, 10, 5)
+    layer_data = point_maps.marker_layer_data(places, (("Name", "name"), ("Address", "address")), "category")
+    base_map = folium.Map(location=map_center, zoom_start=11)
+    point_maps.build_point_layer(layer_data, {}).add_to(base_map)
+    return base_map.get_root().render()
+
+
+# Full script reruns per section through Streamlit's headless AppTest runner
+def run_app(results, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    for section in ['Food Locator', 'Best Place to Live', 'Smart Route Planner']:
+        app = AppTest.from_file('integrated.py', default_timeout=300)
+        app.session_state.selected_section = section
+        time_stage(results, f"app first run: {section}", 1, 0, app.run, 1)
+        time_stage(results, f"app rerun: {section}", 1, 0, app.run, repeat)
+
+
+def run(scales, repeat, app=False):
+    results = []
+    if app:
+        run_app(results, repeat)
+
+    # CSV loads, from text and through the columnar cache
+    for csv_path, source in columnar_cache.sources.items():
+        rows = len(columnar_cache.read_table(csv_path))
+        time_stage(results, f"load csv: {csv_path}", 1, rows,
+                   lambda: pd.read_csv(csv_path, encoding=source['encoding']), repeat)
+        time_stage(results, f"load cached: {csv_path}", 1, rows,
+                   lambda: columnar_cache.read_table(csv_path), repeat)
+
+    fast_food = columnar_cache.read_table(data_prep.csv_path)
+    income_df = data_prep.load_income()
+    us_states_geojson = data_prep.load_us_states()
+    tolerance = geometry.tolerance_for_zoom(geometry.state_map_zoom)
+    state_shapes = geometry.simplify_geojson(us_states_geojson, tolerance)
+    state_geojson = data_prep.join_state_properties(copy.deepcopy(state_shapes), data_prep.count_outlets_by_state(fast_food), income_df)
+    commute_df = commute.load_commute_modes()
+    time_stage(results, "geometry simplify", 1, len(state_shapes['features']),
+               lambda: geometry.simplify_geojson(us_states_geojson, tolerance), repeat)
+    time_stage(results, "pydeck deck build + json", 1, len(state_geojson['features']),
+               lambda: data_prep.build_state_deck(state_geojson).to_json(), repeat)
+    time_stage(results, "commute choropleth build + json", 1, len(commute_df),
+               lambda: commute.build_commute_figure(commute_df, state_shapes).to_json(), repeat)
+    states = [feature['properties']['name'] for feature in state_shapes['features']]
+    cubes = health.build_cubes(states)
+    time_stage(results, "health cubes build", 1, sum(cube.values.size for cube in cubes.values()),
+               lambda: health.build_cubes(states), repeat)
+    time_stage(results, "health cube slice x1000", 1, len(states),
+               lambda: [cube.slice(cube.years[-1], cube.categories[0]) for cube in cubes.values() for _ in range(1000)], repeat)
+    features = scoring.load_state_features(states, cubes)
+    time_stage(results, "state feature matrix build", 1, features.size,
+               lambda: scoring.normalize_features(scoring.load_state_features(states, cubes)), repeat)
+    normalized = scoring.normalize_features(features)
+    weights = np.array([scoring.default_weights.get(name, 0.0) for name in features.columns])
+    time_stage(results, "state score + rank x1000", 1, len(states),
+               lambda: [np.argsort(-scoring.score(normalized, weights)) for _ in range(1000)], repeat)
+    places = spatial_index.load_places()
+    place_lat, place_lon = places['latitude'].to_numpy(), places['longitude'].to_numpy()
+    time_stage(results, "travel time matrix 2000 origins", 1, len(places),
+               lambda: routing.travel_time_matrix(place_lat[:2000], place_lon[:2000], place_lat, place_lon, 'Car'), repeat)
+    stops = tuple(zip(place_lat[:25], place_lon[:25]))
+    time_stage(results, "route order 25 stops (uncached)", 1, len(stops),
+               lambda: routing.plan_route.__wrapped__(map_center, stops, True), repeat)
+
+    for scale in scales:
+        scaled_fast_food = scale_points(fast_food, scale)
+        datasets = {
+            'FastFoodRestaurants.csv': scaled_fast_food.dropna(subset=['latitude', 'longitude']),
+            'cal.csv': scale_points(columnar_cache.read_table('cal.csv'), scale),
+            'fitness_grocery.csv': scale_points(columnar_cache.read_table('fitness_grocery.csv').dropna(subset=['latitude', 'Type']), scale),
+        }
+        rows = len(scaled_fast_food)
+
+        def join_states():
+            state_row_counts = data_prep.count_outlets_by_state(scaled_fast_food)
+            data_prep.join_state_properties(copy.deepcopy(state_shapes), state_row_counts, income_df)
+        time_stage(results, "state join + coloring", scale, rows, join_states, repeat)
+
+        lat = scaled_fast_food['latitude'].to_numpy(dtype=float)
+        lon = scaled_fast_food['longitude'].to_numpy(dtype=float)
+        state_index = region_index.load_state_index()
+        time_stage(results, "state assignment (point in polygon)", scale, rows,
+                   lambda: state_index.assign(lat, lon), repeat)
+        time_stage(results, "density grid (50 km hex)", scale, rows,
+                   lambda: density.density_grid(lat, lon, 50, 'hex'), repeat)
+        time_stage(results, "spatial index build", scale, rows,
+                   lambda: spatial_index.PointIndex(lat, lon), repeat)
+        index = spatial_index.PointIndex(lat, lon)
+        time_stage(results, "spatial index 1000 nearest(k=10)", scale, rows,
+                   lambda: index.nearest_many(lat[:1000], lon[:1000], 10), repeat)
+
+        place_indexes = spatial_index.build_place_indexes(scale_points(spatial_index.load_places(), scale))
+        time_stage(results, "folium maps: Smart Route Planner", scale, rows,
+                   lambda: build_nearby_map(place_indexes), repeat)
+
+        for section, maps in section_maps.items():
+            section_rows = sum(len(datasets[csv_path]) for csv_path, *_ in maps)
+            time_stage(results, f"folium maps: {section}", scale, section_rows,
+                       lambda: build_section_maps(maps, datasets), repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the dashboard's data and render pipeline without a browser")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help="point dataset scale factors")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the median is reported")
+    parser.add_argument('--app', action='store_true', help="also time full app runs per section with AppTest")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scales': args.scales,
+        'results': run(args.scales, args.repeat, args.app),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import region_index
+
+# Directory holding the typed Parquet copies of the input CSVs
+cache_dir = '.data_cache'
+
+# Files the normalizers depend on besides the CSVs; the caches are rebuilt when one of them is newer
+normalizer_paths = [__file__, region_index.__file__, region_index.state_geojson_path]
+
+
+# Remove the thousands separators (including Indian-style "1,14,201" grouping) and convert to integers
+def parse_grouped_number(values):
+    return pd.to_numeric(values.astype(str).str.replace(',', ''), errors='coerce').astype('Int64')
+
+
+# Add the state each point lies in, by its coordinates rather than the free-text address columns
+def with_states(df):
+    df['state'] = region_index.load_state_index().lookup(df['latitude'], df['longitude'])
+    return df
+
+
+# Per-source normalizers: drop unused columns, use float32 coordinates and categorical labels
+def normalize_fast_food(df):
+    df = df.drop(columns=['keys', 'country'])
+    df = df.astype({'latitude': 'float32', 'longitude': 'float32', 'name': 'category', 'province': 'category', 'city': 'category'})
+    return with_states(df)
+
+
+def normalize_cal(df):
+    df = df.drop(columns=['id', 'keys', 'country', 'categories'])
+    df = df.astype({'latitude': 'float32', 'longitude': 'float32', 'name': 'category', 'province': 'category', 'city': 'category'})
+    return with_states(df)
+
+
+def normalize_household_income(df):
+    df = df[['states', 'Total', 'Median income (dollars)', 'Mean income (dollars)']].copy()
+    df['Total'] = parse_grouped_number(df['Total'])  # households
+    df['Median income (dollars)'] = parse_grouped_number(df['Median income (dollars)'])
+    df['Mean income (dollars)'] = parse_grouped_number(df['Mean income (dollars)'])
+    return df
+
+
+def normalize_fitness_grocery(df):
+    # Drop the trailing empty columns and the blank rows
+    df = df.loc[:, ~df.columns.str.startswith('Unnamed')].dropna(how='all')
+    df = df.astype({'latitude': 'float32', 'longitude': 'float32', 'name': 'category', 'Type': 'category'})
+    return with_states(df)
+
+
+def normalize_commuting_modes(df):
+    modes = ['Bike (%)', 'Car (%)', 'Public Transport (%)', 'Walking (%)']
+    return df.astype({mode: 'float32' for mode in modes})
+
+
+def normalize_deaths(df):
+    df = df.copy()
+    df['Deaths'] = parse_grouped_number(df['Deaths'])
+    return df.astype({'Year': 'int16', 'Cause Name': 'category', 'State': 'category', 'Age-adjusted Death Rate': 'float32'})
+
+
+def normalize_obesity(df):
+    # Keep the value and the columns that place it; the rest repeats the survey metadata
+    df = df[['YearStart', 'LocationDesc', 'StratificationCategory1', 'Stratification1', 'Data_Value', 'Sample_Size']]
+    return df.astype({
+        'YearStart': 'int16', 'LocationDesc': 'category', 'StratificationCategory1': 'category',
+        'Stratification1': 'category', 'Data_Value': 'float32',
+    })
+
+
+# How each source CSV is parsed and normalized before it is written to the cache
+sources = {
+    'FastFoodRestaurants.csv': {'encoding': None, 'normalize': normalize_fast_food},
+    'cal.csv': {'encoding': None, 'normalize': normalize_cal},
+    'Household_income.csv': {'encoding': 'ISO-8859-1', 'normalize': normalize_household_income},
+    'fitness_grocery.csv': {'encoding': 'ISO-8859-1', 'normalize': normalize_fitness_grocery},
+    'us_commuting_modes.csv': {'encoding': None, 'normalize': normalize_commuting_modes},
+    'Deaths_data.csv': {'encoding': None, 'normalize': normalize_deaths},
+    'obesity.csv': {'encoding': None, 'normalize': normalize_obesity},
+}
+
+
+def cache_path(csv_path):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0] + '.parquet')
+
+
+# Parse and normalize a source CSV and write its typed Parquet copy
+def ingest(csv_path):
+    source = sources[os.path.basename(csv_path)]
+    df = source['normalize'](pd.read_csv(csv_path, encoding=source['encoding']))
+
+    # Write to a temporary file first so readers never see a half-written cache
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(csv_path)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+    return path
+
+
+# Return the Parquet copy of a source CSV, rebuilding it when the CSV or the normalizers are newer
+def ensure_cached(csv_path):
+    path = cache_path(csv_path)
+    newest_source = max(os.path.getmtime(source) for source in [csv_path, *normalizer_paths])
+    if not os.path.exists(path) or os.path.getmtime(path) < newest_source:
+        path = ingest(csv_path)
+    return path
+
+
+# Read a source through the cache, loading only the requested columns that exist
+def read_table(csv_path, columns=None):
+    path = ensure_cached(csv_path)
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [column for column in columns if column in available]
+    return pd.read_parquet(path, columns=columns)
+
+
+# Rebuild every cache and compare cold loads from CSV and from Parquet
+if __name__ == '__main__':
+    for csv_path in sources:
+        ingest(csv_path)
+    for csv_path, source in sources.items():
+        start = time.perf_counter()
+        csv_df = pd.read_csv(csv_path, encoding=source['encoding'])
+        csv_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        cached_df = read_table(csv_path)
+        cached_ms = (time.perf_counter() - start) * 1000
+        csv_mb = csv_df.memory_usage(deep=True).sum() / 2 ** 20
+        cached_mb = cached_df.memory_usage(deep=True).sum() / 2 ** 20
+        print(f"{csv_path}: csv {csv_ms:.1f} ms / {csv_mb:.2f} MB, parquet {cached_ms:.1f} ms / {cached_mb:.2f} MB")
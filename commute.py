@@ -0,0 +1,90 @@
+import json
+import time
+
+import plotly.colors
+import plotly.graph_objects as go
+
+import columnar_cache
+
+# Path to the commute mode shares
+commute_csv_path = 'us_commuting_modes.csv'
+
+# Commute modes and the color scheme each one is drawn with
+color_schemes = {
+    'Car': 'Reds',
+    'Bike': 'Blues',
+    'Public Transport': 'Greens',
+    'Walking': 'Purples'
+}
+
+
+def load_commute_modes(path=commute_csv_path):
+    return columnar_cache.read_table(path)
+
+
+# One choropleth carrying every commute mode.
+# The mode buttons restyle the trace's values, color scale and title in the browser,
+# so switching modes needs no rerun and the state shapes are sent once.
+# Color scales are sent as explicit color lists: Plotly.js resolves bare names itself,
+# and its own Blues, Greens and Reds differ from Python's (it has no Purples at all).
+def build_commute_figure(commute_df, state_shapes):
+    modes = list(color_schemes)
+    colorscales = {mode: plotly.colors.get_colorscale(scheme) for mode, scheme in color_schemes.items()}
+    columns = [f'{mode} (%)' for mode in modes]
+    first = modes[0]
+    hover_lines = '<br>'.join(f'{column}: %{{customdata[{i}]:.2f}}' for i, column in enumerate(columns))
+
+    fig = go.Figure(go.Choropleth(
+        geojson=state_shapes,
+        featureidkey='properties.name',
+        locations=commute_df['State'],
+        z=commute_df[columns[0]],
+        customdata=commute_df[columns],
+        colorscale=colorscales[first],
+        colorbar={'title': {'text': columns[0]}},
+        hovertemplate=f'<b>%{{location}}</b><br>{hover_lines}<extra></extra>',
+    ))
+    fig.update_layout(
+        title=f'US Commute Modes - {first} Commuting Percentage',
+        updatemenus=[{
+            'type': 'buttons',
+            'direction': 'right',
+            'x': 0,
+            'xanchor': 'left',
+            'y': 1.08,
+            'yanchor': 'bottom',
+            'buttons': [
+                {
+                    'label': mode,
+                    'method': 'update',
+                    'args': [
+                        {'z': [commute_df[column]], 'colorscale': [colorscales[mode]],
+                         'colorbar.title.text': column},
+                        {'title.text': f'US Commute Modes - {mode} Commuting Percentage'},
+                    ],
+                }
+                for mode, column in zip(modes, columns)
+            ],
+        }],
+    )
+
+    # Update the map layout
+    fig.update_geos(
+        scope='usa',
+        visible=True,
+        projection_type="albers usa"
+    )
+    return fig
+
+
+# Time building the figure and report its payload size
+if __name__ == '__main__':
+    import data_prep
+
+    commute_df = load_commute_modes()
+    state_shapes = data_prep.load_us_states()
+    start = time.perf_counter()
+    fig = build_commute_figure(commute_df, state_shapes)
+    payload = fig.to_json()
+    print(f"Built the commute figure in {(time.perf_counter() - start) * 1000:.1f} ms, {len(payload) / 1024:.0f} KB")
+    print(f"{len(json.loads(payload)['layout']['updatemenus'][0]['buttons'])} mode buttons")
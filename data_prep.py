@@ -0,0 +1,164 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+
+import columnar_cache
+import region_index
+
+# Path to the CSV file and GeoJSON file
+csv_path = 'FastFoodRestaurants.csv'
+geojson_path = region_index.state_geojson_path
+income_csv_path = 'Household_income.csv'
+
+# Modification times of the source files, used as the cache key for the prepared data
+def source_mtimes(*paths):
+    paths = paths or (csv_path, geojson_path, income_csv_path)
+    return tuple(os.path.getmtime(path) for path in paths)
+
+
+# Count fast food outlets per state, keyed on the full state name
+def load_state_row_counts(path=csv_path):
+    return count_outlets_by_state(columnar_cache.read_table(path))
+
+
+def count_outlets_by_state(df):
+    # Filter out rows with duplicate (latitude, longitude) pairs and remove NA values
+    df_unique = df.drop_duplicates(subset=['latitude', 'longitude']).dropna()
+
+    # Count the outlets (fast food chains) per state their coordinates fall in; points outside every state are left out
+    return state_counts_frame(df_unique.groupby('state', observed=True).size())
+
+
+# Turn outlet counts indexed by state name into the per-state count table
+def state_counts_frame(state_counts):
+    state_row_counts = state_counts.rename_axis('state').reset_index(name='row_count')
+    return state_row_counts.astype({'state': str})
+
+
+# Load the household income dataset
+def load_income(path=income_csv_path):
+    return columnar_cache.read_table(path, columns=['states', 'Mean income (dollars)'])  # Keep only relevant columns
+
+
+# Load the GeoJSON data for US states
+def load_us_states(path=geojson_path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Upper bounds of the household income color ranges (0 to 130,000, increments of 15,000)
+income_bins = [75000, 90000, 105000, 120000, 130000]
+
+# Color for each income range, plus one for income above 130,000
+income_colors = np.array([
+    [247, 251, 255, 255],  # 0–75,000
+    [224, 236, 244, 255],  # 75,001–90,000
+    [158, 188, 218, 255],  # 90,001–105,000
+    [110, 1, 107, 255],  # 105,001–120,000
+    [77, 0, 75, 255],  # 120,001–130,000
+    [42, 0, 72, 255],  # above 130,000
+])
+
+
+# Join outlet counts and income onto the GeoJSON state names in a single vectorized pass
+def build_state_table(state_names, state_row_counts, income_df):
+    state_table = pd.DataFrame({'name': state_names})
+
+    # Indexed lookups on the state name instead of a boolean scan per state
+    counts = state_row_counts.drop_duplicates('state').set_index('state')['row_count']
+    incomes = income_df.drop_duplicates('states', keep='last').set_index('states')['Mean income (dollars)']
+    row_count = state_table['name'].map(counts).fillna(0)
+    income = state_table['name'].map(incomes).fillna(0).astype('int64')  # Default income to 0 if not found
+    state_table['income'] = income
+    state_table['income_label'] = income.map('{:,}'.format)
+
+    state_table['height'] = row_count / 10
+    state_table['height_n'] = state_table['height'] * 10
+
+    # Bin the income values into the color ranges
+    state_table['color'] = income_colors[np.digitize(income, income_bins, right=True)].tolist()
+    return state_table
+
+
+# Build the joined per-state GeoJSON (outlet counts, income, heights, colors)
+# Pass already loaded (for example simplified) state shapes as us_states_geojson to skip reading geojson_path
+def prepare_state_geojson(csv_path=csv_path, geojson_path=geojson_path, income_csv_path=income_csv_path,
+                          us_states_geojson=None):
+    state_row_counts = load_state_row_counts(csv_path)
+    if us_states_geojson is None:
+        us_states_geojson = load_us_states(geojson_path)
+    income_df = load_income(income_csv_path)
+    return join_state_properties(us_states_geojson, state_row_counts, income_df)
+
+
+# Join the per-state table onto the GeoJSON features, updating them in place
+def join_state_properties(us_states_geojson, state_row_counts, income_df):
+    features = us_states_geojson['features']
+    state_table = build_state_table([feature['properties']['name'] for feature in features], state_row_counts, income_df)
+
+    # Write the joined columns back into the feature properties in one step
+    for feature, properties in zip(features, state_table.drop(columns='name').to_dict('records')):
+        feature['properties'].update(properties)
+
+    return us_states_geojson
+
+
+# Set the initial view for the state maps
+view_state = pdk.ViewState(
+    longitude=-98.35, latitude=39.5, zoom=2.6,
+    pitch=80,
+    bearing=-30
+)
+
+# Tooltip of the state deck: household income and outlet density
+tooltip_content = """
+<div style="background-color: #ffffcc; border-radius: 8px; padding: 10px; box-shadow: 0px 4px 8px rgba(0, 0, 0, 0.2); font-family: Arial, sans-serif; font-size: 12px;">
+    <b>{name}</b><br/>
+    {html_content}
+</div>
+"""
+tooltip_html = (
+    "Income: ${income_label}<br/>Density: {height_n}"
+)
+tooltip = {
+    "html": tooltip_content.replace("{html_content}", tooltip_html),
+    "style": {
+        "color": "black",
+        "text-align": "center",
+        "font-weight": "bold",
+    },
+}
+
+
+# Build the Deck.gl state map of the joined per-state GeoJSON: height is outlet density, color is income
+def build_state_deck(state_geojson):
+    polygon_layer = pdk.Layer(
+        "GeoJsonLayer",
+        state_geojson,
+        pickable=True,
+        stroked=False,
+        filled=True,
+        extruded=True,
+        get_fill_color="properties.color",
+        get_elevation="properties.height",
+        elevation_scale=10000,
+        wireframe=True,
+    )
+    return pdk.Deck(
+        layers=[polygon_layer],
+        initial_view_state=view_state,
+        tooltip=tooltip,
+        map_style="mapbox://styles/mapbox/light-v10",
+    )
+
+
+# Run the preparation stage on its own and report how long it takes
+if __name__ == '__main__':
+    start = time.perf_counter()
+    us_states_geojson = prepare_state_geojson()
+    elapsed = time.perf_counter() - start
+    print(f"Prepared {len(us_states_geojson['features'])} states in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,159 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+import spatial_index
+
+# Kilometers per degree of latitude
+km_per_degree = spatial_index.km_per_degree
+
+# Offsets that pack two signed cell coordinates into one int64 key
+key_offset = 1 << 30
+key_stride = 1 << 31
+
+
+# Project to a sinusoidal (equal-area) plane in kilometers, so every cell covers the same ground area
+def project(lat, lon):
+    return lon * km_per_degree * np.cos(np.radians(lat)), lat * km_per_degree
+
+
+def unproject(x, y):
+    lat = y / km_per_degree
+    return lat, x / (km_per_degree * np.cos(np.radians(lat)))
+
+
+def pack(q, r):
+    return (q + key_offset) * key_stride + (r + key_offset)
+
+
+def unpack(keys):
+    return keys // key_stride - key_offset, keys % key_stride - key_offset
+
+
+# Pointy-top hexagons of the given center-to-corner size, in axial (q, r) coordinates
+def hex_cells(x, y, size):
+    q = (math.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # Round cube coordinates and fix up the component with the largest rounding error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_centers(q, r, size):
+    return size * math.sqrt(3) * (q + r / 2), size * 1.5 * r
+
+
+def square_cells(x, y, size):
+    return np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+
+
+def square_centers(q, r, size):
+    return (q + 0.5) * size, (r + 0.5) * size
+
+
+# Cell geometry for each grid shape: binning, cell centers and cell area
+grid_shapes = {
+    'hex': (hex_cells, hex_centers, lambda size: 1.5 * math.sqrt(3) * size ** 2),
+    'square': (square_cells, square_centers, lambda size: size ** 2),
+}
+
+
+# Neighbor offsets within `rings` cells, with their distance from the center cell in cell widths
+def neighbor_offsets(shape, rings):
+    offsets = []
+    for dq in range(-rings, rings + 1):
+        for dr in range(-rings, rings + 1):
+            if shape == 'hex':
+                distance = max(abs(dq), abs(dr), abs(dq + dr))
+            else:
+                distance = math.hypot(dq, dr)
+            if distance <= rings:
+                offsets.append((dq, dr, distance))
+    return offsets
+
+
+# Spread each cell's count over its neighbors with a Gaussian kernel of `bandwidth` cells
+def smooth(keys, counts, shape, bandwidth):
+    q, r = unpack(keys)
+    rings = int(math.ceil(2 * bandwidth))
+    offsets = neighbor_offsets(shape, rings)
+    weights = np.array([math.exp(-distance ** 2 / (2 * bandwidth ** 2)) for _, _, distance in offsets])
+    weights /= weights.sum()
+
+    spread_keys = np.concatenate([pack(q + dq, r + dr) for dq, dr, _ in offsets])
+    spread_values = np.concatenate([counts * weight for weight in weights])
+    smoothed_keys, index = np.unique(spread_keys, return_inverse=True)
+    return smoothed_keys, np.bincount(index.ravel(), weights=spread_values)
+
+
+# Size parameter of a grid shape for cells `cell_km` across.
+# A hex "size" is center-to-corner; use the flat-to-flat width as the cell width.
+def cell_size(cell_km, shape):
+    return cell_km / math.sqrt(3) if shape == 'hex' else cell_km
+
+
+# Packed cell key of every point
+def cell_keys(lat, lon, cell_km=25, shape='hex'):
+    cells = grid_shapes[shape][0]
+    x, y = project(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    return pack(*cells(x, y, cell_size(cell_km, shape)))
+
+
+# Bin points into a hex or square grid of cells `cell_km` across.
+# Returns one row per non-empty cell with its center, count and density per km²;
+# with a bandwidth (in cells) the counts are also kernel smoothed onto neighboring cells.
+def density_grid(lat, lon, cell_km=25, shape='hex', bandwidth=None):
+    keys, counts = np.unique(cell_keys(lat, lon, cell_km, shape), return_counts=True)
+    return grid_from_counts(keys, counts, cell_km, shape, bandwidth)
+
+
+# The density grid for already binned points: sorted cell keys and their counts
+def grid_from_counts(keys, counts, cell_km=25, shape='hex', bandwidth=None):
+    _, centers, cell_area = grid_shapes[shape]
+    size = cell_size(cell_km, shape)
+    keys = np.asarray(keys)
+    counts = np.asarray(counts, dtype=float)
+    smoothed = None
+    if bandwidth:
+        smoothed_keys, smoothed = smooth(keys, counts, shape, bandwidth)
+        # Keep the smoothed surface on its own cell set, reporting the raw count where there is one
+        raw = pd.Series(counts, index=keys).reindex(smoothed_keys, fill_value=0).to_numpy()
+        keys, counts = smoothed_keys, raw
+
+    cell_lat, cell_lon = unproject(*centers(*unpack(keys), size))
+    grid = pd.DataFrame({'latitude': cell_lat, 'longitude': cell_lon, 'count': counts})
+    grid['density'] = grid['count'] / cell_area(size)
+    if smoothed is not None:
+        grid['smoothed'] = smoothed
+        grid['smoothed_density'] = smoothed / cell_area(size)
+    return grid
+
+
+# Unique fast food outlet coordinates
+def load_outlet_points(path='FastFoodRestaurants.csv'):
+    points = columnar_cache.read_table(path, columns=['latitude', 'longitude']).dropna().drop_duplicates()
+    return points['latitude'].to_numpy(dtype=float), points['longitude'].to_numpy(dtype=float)
+
+
+# Time the binning on the outlet dataset and on synthetic millions of points
+if __name__ == '__main__':
+    lat, lon = load_outlet_points()
+    rng = np.random.default_rng(0)
+    for copies in (1, 100, 300):
+        # Jitter repeated copies of the real points by ~5 km to get a realistic large dataset
+        big_lat = np.repeat(lat, copies) + rng.normal(0, 0.05, len(lat) * copies)
+        big_lon = np.repeat(lon, copies) + rng.normal(0, 0.05, len(lon) * copies)
+        for shape in ('hex', 'square'):
+            start = time.perf_counter()
+            grid = density_grid(big_lat, big_lon, 10, shape, bandwidth=1.5)
+            elapsed = time.perf_counter() - start
+            print(f"{len(big_lat):>9} points, {shape:>6}: {len(grid)} cells in {elapsed * 1000:.0f} ms")
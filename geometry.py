@@ -0,0 +1,49 @@
+import json
+import math
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+# Zoom level the state maps are simplified for; the tilted pydeck view and the
+# Plotly Albers USA map both show the lower 48 at about this level of detail
+state_map_zoom = 4
+
+
+# Simplification tolerance in degrees that keeps the error under `pixels` screen pixels at a zoom level
+def tolerance_for_zoom(zoom, pixels=0.5):
+    return 360 / (256 * 2 ** zoom) * pixels
+
+
+# Number of decimals that keeps coordinate rounding well below the simplification tolerance
+def decimals_for_tolerance(tolerance):
+    return max(0, math.ceil(-math.log10(tolerance)) + 1)
+
+
+# Simplify every feature of a GeoJSON FeatureCollection and quantize its coordinates.
+# preserve_topology keeps rings valid and stops small islands and holes from collapsing.
+def simplify_geojson(geojson, tolerance):
+    features = geojson['features']
+    geometries = np.array([shape(feature['geometry']) for feature in features])
+    simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    decimals = decimals_for_tolerance(tolerance)
+    quantized = shapely.transform(simplified, lambda coordinates: np.round(coordinates, decimals))
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {**feature, 'geometry': mapping(geometry)} for feature, geometry in zip(features, quantized)
+        ],
+    }
+
+
+# Report vertex counts and payload sizes for a range of zoom levels
+if __name__ == '__main__':
+    with open('us-states.json') as f:
+        us_states_geojson = json.load(f)
+    full_size = len(json.dumps(us_states_geojson))
+    print(f"full: {full_size / 1024:.0f} KB")
+    for zoom in range(2, 9):
+        simplified = simplify_geojson(us_states_geojson, tolerance_for_zoom(zoom))
+        vertices = sum(shapely.get_num_coordinates([shape(feature['geometry']) for feature in simplified['features']]))
+        size = len(json.dumps(simplified))
+        print(f"zoom {zoom}: {vertices} vertices, {size / 1024:.0f} KB ({size / full_size:.0%} of full)")
@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+
+# Path to the health outcome CSV files
+deaths_csv_path = 'Deaths_data.csv'
+obesity_csv_path = 'obesity.csv'
+
+# Health measures: (source CSV, year column, state column, category column, value column)
+measures = {
+    'Age-adjusted death rate (per 100,000)': (deaths_csv_path, 'Year', 'State', 'Cause Name', 'Age-adjusted Death Rate'),
+    'Deaths': (deaths_csv_path, 'Year', 'State', 'Cause Name', 'Deaths'),
+    'Adult obesity (%)': (obesity_csv_path, 'YearStart', 'LocationDesc', 'Stratification1', 'Data_Value'),
+}
+
+# Color ramp from light yellow (lowest) to dark red (highest), and the color of states without data
+low_color = np.array([255, 237, 160])
+high_color = np.array([189, 0, 38])
+missing_color = [200, 200, 200]
+
+
+# One measure pre-aggregated into a state × year × category array.
+# Slicing a year and category is an array index that returns one value per state, in `states` order.
+class HealthCube:
+    def __init__(self, values, states, years, categories):
+        self.values = values
+        self.states = list(states)
+        self.years = [int(year) for year in years]
+        self.categories = list(categories)
+        self._year_index = {year: i for i, year in enumerate(self.years)}
+        self._category_index = {category: i for i, category in enumerate(self.categories)}
+        # Range of each category over every state and year, so colors stay comparable between years
+        with np.errstate(all='ignore'):
+            self._ranges = np.stack([np.nanmin(values, axis=(0, 1)), np.nanmax(values, axis=(0, 1))], axis=1)
+
+    def slice(self, year, category):
+        return self.values[:, self._year_index[year], self._category_index[category]]
+
+    def value_range(self, category):
+        low, high = self._ranges[self._category_index[category]]
+        return float(low), float(high)
+
+
+# Aggregate a table into a cube, averaging repeated (state, year, category) rows.
+# Rows for places outside `states` (national totals, territories) are dropped.
+def build_cube(df, year_column, state_column, category_column, value_column, states):
+    state_codes = pd.Index(states).get_indexer(df[state_column].astype(str))
+    years, year_codes = np.unique(df[year_column].to_numpy(), return_inverse=True)
+    categories = pd.Categorical(df[category_column].astype(str))
+    values = df[value_column].to_numpy(dtype=float, na_value=np.nan)
+
+    keep = (state_codes >= 0) & ~np.isnan(values)
+    shape = (len(states), len(years), len(categories.categories))
+    cells = np.ravel_multi_index((state_codes[keep], year_codes[keep], categories.codes[keep]), shape)
+    sums = np.bincount(cells, weights=values[keep], minlength=np.prod(shape))
+    counts = np.bincount(cells, minlength=np.prod(shape))
+    with np.errstate(invalid='ignore'):
+        cube = (sums / counts).astype('float32').reshape(shape)
+    return HealthCube(cube, states, years, categories.categories)
+
+
+# Build every health measure's cube over the given state names
+def build_cubes(states):
+    tables = {}
+    cubes = {}
+    for measure, (csv_path, year_column, state_column, category_column, value_column) in measures.items():
+        if csv_path not in tables:
+            tables[csv_path] = columnar_cache.read_table(csv_path)
+        cubes[measure] = build_cube(tables[csv_path], year_column, state_column, category_column, value_column, states)
+    return cubes
+
+
+# RGB color for each value on the low-to-high ramp, grey where a state has no data
+def value_colors(values, low, high, low_color=low_color, high_color=high_color):
+    share = np.clip(np.nan_to_num((values - low) / ((high - low) or 1)), 0, 1)[:, None]
+    colors = (low_color * (1 - share) + high_color * share).astype(int).tolist()
+    return [missing_color if np.isnan(value) else color for value, color in zip(values, colors)]
+
+
+# Display label for each value
+def value_labels(values):
+    return ["no data" if np.isnan(value) else f"{value:,.1f}" for value in values]
+
+
+# Time building the cubes and slicing them
+if __name__ == '__main__':
+    import data_prep
+
+    states = [feature['properties']['name'] for feature in data_prep.load_us_states()['features']]
+    start = time.perf_counter()
+    cubes = build_cubes(states)
+    print(f"Built {len(cubes)} cubes in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for measure, cube in cubes.items():
+        start = time.perf_counter()
+        for _ in range(10000):
+            cube.slice(cube.years[-1], cube.categories[0])
+        elapsed = (time.perf_counter() - start) * 100
+        print(f"{measure}: {cube.values.shape} cells, {elapsed:.2f} µs per slice")
@@ -0,0 +1,225 @@
+import collections
+import contextlib
+import functools
+import http.server
+import json
+import os
+import threading
+import time
+
+# Recent durations kept per (stage, name) for the latency percentiles
+recent_limit = 1000
+
+# Streamlit runs each session's script on its own thread, so the current rerun is thread-local
+_local = threading.local()
+_lock = threading.Lock()
+_durations = collections.defaultdict(lambda: collections.deque(maxlen=recent_limit))
+_totals = collections.defaultdict(lambda: {'count': 0, 'sum_ms': 0.0, 'first_ms': None})
+_cache_results = collections.Counter()
+_server = None
+
+# Optional exporters, configured from the environment; /metrics is only reachable from this machine by default
+jsonl_path = os.environ.get('METRICS_JSONL')
+metrics_host = os.environ.get('METRICS_HOST', '127.0.0.1')
+metrics_port = os.environ.get('METRICS_PORT')
+metrics_error = None
+
+
+# Resident memory of this process in bytes
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Begin recording the spans of one script run
+def start_rerun():
+    _local.rerun = {'timestamp': time.time(), 'section': None, 'spans': []}
+    _local.stack = []
+    _local.start = time.perf_counter()
+
+
+# Name the section the current run renders, once the script knows it
+def set_section(section):
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun['section'] = section
+
+
+# Time a stage of the app: stage is one of load, transform, build or render, name says what ran.
+# Spans marked cached report a cache hit unless cache_miss() is called while they are open.
+@contextlib.contextmanager
+def span(stage, name, cached=False):
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    record = {'stage': stage, 'name': name, 'cached': cached, 'missed': False}
+    stack.append(record)
+    start_rss = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+        record['memory_delta_kb'] = (rss_bytes() - start_rss) // 1024
+        stack.pop()
+        if record.pop('cached'):
+            record['cache'] = 'miss' if record['missed'] else 'hit'
+        del record['missed']
+        _record(record)
+
+
+# Time a Streamlit fragment. Inside a full script run it is one more span; when a widget
+# reruns just the fragment, that rerun is recorded as a run of its own named after it.
+def fragment(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'rerun', None) is not None:
+                with span('fragment', name):
+                    return fn(*args, **kwargs)
+            start_rerun()
+            set_section(f"fragment: {name}")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finish_rerun()
+        return wrapper
+    return decorate
+
+
+# Called from inside a cached function body; it only runs when the cache missed
+def cache_miss():
+    for record in reversed(getattr(_local, 'stack', None) or []):
+        if record['cached']:
+            record['missed'] = True
+            return
+
+
+def _record(record):
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun['spans'].append(record)
+    key = (record['stage'], record['name'])
+    with _lock:
+        _durations[key].append(record['ms'])
+        totals = _totals[key]
+        totals['count'] += 1
+        totals['sum_ms'] += record['ms']
+        if totals['first_ms'] is None:
+            totals['first_ms'] = record['ms']
+        if 'cache' in record:
+            _cache_results[key + (record['cache'],)] += 1
+
+
+# Finish the current run, record its total time and export it; returns the run record
+def finish_rerun():
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        return None
+    rerun['total_ms'] = round((time.perf_counter() - _local.start) * 1000, 3)
+    rerun['rss_mb'] = round(rss_bytes() / 2 ** 20, 1)
+    for record in rerun['spans']:
+        record['section'] = rerun['section']
+    _local.rerun = None
+    _record({'stage': 'rerun', 'name': rerun['section'], 'ms': rerun['total_ms']})
+    if jsonl_path:
+        with _lock, open(jsonl_path, 'a') as f:
+            f.write(json.dumps(rerun) + '\n')
+    return rerun
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Latency summary per (stage, name) over the recent runs of this process
+def summary():
+    with _lock:
+        rows = []
+        for (stage, name), durations in _durations.items():
+            totals = _totals[(stage, name)]
+            rows.append({
+                'stage': stage,
+                'name': name,
+                'count': totals['count'],
+                'first_ms': totals['first_ms'],
+                'p50_ms': _percentile(durations, 0.5),
+                'p90_ms': _percentile(durations, 0.9),
+                'p99_ms': _percentile(durations, 0.99),
+                'cache_hits': _cache_results[(stage, name, 'hit')],
+                'cache_misses': _cache_results[(stage, name, 'miss')],
+            })
+        return rows
+
+
+def _labels(**labels):
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"') for key, value in labels.items()}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped.items()) + '}'
+
+
+# Prometheus text exposition of the stage latencies and cache results
+def prometheus_text():
+    lines = [
+        '# HELP app_stage_duration_ms Wall time of each app stage in milliseconds.',
+        '# TYPE app_stage_duration_ms summary',
+    ]
+    for row in summary():
+        labels = {'stage': row['stage'], 'name': row['name']}
+        for quantile in ('0.5', '0.9', '0.99'):
+            value = row[f"p{round(float(quantile) * 100)}_ms"]
+            lines.append(f"app_stage_duration_ms{_labels(**labels, quantile=quantile)} {value}")
+        totals = _totals[(row['stage'], row['name'])]
+        lines.append(f"app_stage_duration_ms_sum{_labels(**labels)} {totals['sum_ms']}")
+        lines.append(f"app_stage_duration_ms_count{_labels(**labels)} {totals['count']}")
+    lines += [
+        '# HELP app_cache_requests_total Cached stage lookups by result.',
+        '# TYPE app_cache_requests_total counter',
+    ]
+    with _lock:
+        for (stage, name, result), count in sorted(_cache_results.items()):
+            lines.append(f"app_cache_requests_total{_labels(stage=stage, name=name, result=result)} {count}")
+    lines += [
+        '# HELP app_resident_memory_bytes Resident memory of the app process.',
+        '# TYPE app_resident_memory_bytes gauge',
+        f"app_resident_memory_bytes {rss_bytes()}",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics on a background thread, once per process.
+# When the port is taken, for example by another replica on the same host, the bind is not retried:
+# metrics_error says why, and this process goes without /metrics.
+def start_metrics_server(host=metrics_host, port=metrics_port):
+    global _server, metrics_error
+    with _lock:
+        if _server is not None or not port:
+            return _server or None
+        try:
+            _server = http.server.ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        except OSError as error:
+            _server = False
+            metrics_error = f"Metrics not served on {host}:{port}: {error.strerror or error}"
+            return None
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -1,151 +1,489 @@
+import math
+
+import numpy as np
 import pandas as pd
 import pydeck as pdk
-import json
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
 import plotly.express as px
-import geopandas as gpd
-
-# Path to the CSV file and GeoJSON file
-csv_path = 'FastFoodRestaurants.csv'
-geojson_path = 'us-states.json'
-income_csv_path = 'Household_income.csv'
-
-# Load the CSV data for fast food chains
-df = pd.read_csv(csv_path)
-
-# Filter out rows with duplicate (latitude, longitude) pairs and remove NA values
-df_unique = df.drop_duplicates(subset=['latitude', 'longitude']).dropna()
-
-# Group data by province (state) and count the number of rows (fast food chains) for each state
-state_row_counts = df_unique.groupby('province').size().reset_index(name='row_count')
-
-# Drop the row where the province is 'Co Spgs'
-state_row_counts = state_row_counts[state_row_counts['province'] != 'Co Spgs']
-
-# Define a mapping of state abbreviations to full names
-state_abbreviation_to_name = {
-    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
-    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'FL': 'Florida', 'GA': 'Georgia',
-    'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas',
-    'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland', 'MA': 'Massachusetts',
-    'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana',
-    'NE': 'Nebraska', 'NV': 'Nevada', 'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico',
-    'NY': 'New York', 'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma',
-    'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota',
-    'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington',
-    'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming', 'DC': 'District of Columbia'
+
+import commute
+import data_prep
+import density
+import geometry
+import health
+import instrumentation
+import point_maps
+import prepared_store
+import routing
+import scoring
+import spatial_index
+import task_graph
+
+# Time every stage of this run; /metrics is only served when METRICS_PORT is set
+instrumentation.start_rerun()
+instrumentation.start_metrics_server()
+if instrumentation.metrics_error:
+    st.sidebar.warning(instrumentation.metrics_error)
+
+
+# Prepare every shared artifact concurrently on the first run of a process, unless a build
+# from the current sources already exists. Returns the task report, or None when nothing was built.
+# While another process builds, or when the build fails, the loaders below prepare their data in process.
+@st.cache_resource
+def warm_start(mtimes):
+    instrumentation.cache_miss()
+    if prepared_store.current_build() is not None:
+        return None
+    try:
+        built = prepared_store.build(wait=False)
+    except Exception as error:
+        return f"Build failed, preparing in process: {error!r}"
+    if built is None:
+        return "Another process is building the prepared store; preparing in process"
+    _, timings = built
+    return task_graph.report(prepared_store.preparation_tasks(), timings)
+
+
+with instrumentation.span("load", "warm start", cached=True):
+    warm_start_report = warm_start(tuple(prepared_store.source_mtimes().values()))
+
+
+# Simplified, quantized state shapes, shared by the pydeck and Plotly maps.
+# Each loader below uses the shared prepared store when `python prepared_store.py` built it from
+# the current sources, and prepares the data in this process otherwise.
+@st.cache_data
+def load_state_shapes(mtime):
+    instrumentation.cache_miss()
+    prepared = prepared_store.load("state_shapes")
+    if prepared is not None:
+        return prepared
+    tolerance = geometry.tolerance_for_zoom(geometry.state_map_zoom)
+    return geometry.simplify_geojson(data_prep.load_us_states(), tolerance)
+
+
+# Cache key of load_state_shapes. Loaders that call it compute the key from its own source file,
+# never by position from their own key tuple, so those tuples can list their sources in any order.
+def state_shapes_mtime():
+    return data_prep.source_mtimes(data_prep.geojson_path)[0]
+
+
+# Build the joined per-state GeoJSON once and share it across sessions and reruns.
+# The source file modification times are part of the cache key, so editing a CSV rebuilds it.
+@st.cache_data
+def load_state_geojson(mtimes):
+    instrumentation.cache_miss()
+    prepared = prepared_store.load("state_geojson")
+    if prepared is not None:
+        return prepared
+    return data_prep.prepare_state_geojson(us_states_geojson=load_state_shapes(state_shapes_mtime()))
+
+
+# Initialize to show the fast food map by default (Fast Food Chains visualization is selected by default)
+show_household_income = "Household Income"
+
+
+# Build the Deck.gl visualization once per set of source files
+@st.cache_resource
+def build_deck(mtimes):
+    instrumentation.cache_miss()
+    return data_prep.build_state_deck(load_state_geojson(mtimes))
+
+
+with instrumentation.span("build", "state deck", cached=True):
+    deck = build_deck(data_prep.source_mtimes())
+
+# Define a mapping for Types to icons and colors
+type_icon_mapping = {
+    "fitness": {"icon": "heartbeat", "color": "red"},
+    "grocery": {"icon": "shopping-cart", "color": "green"},
 }
 
-# Map state abbreviations in 'province' column to full state names
-state_row_counts['province'] = state_row_counts['province'].replace(state_abbreviation_to_name)
 
-# Load the GeoJSON data for US states
-with open(geojson_path) as f:
-    us_states_geojson = json.load(f)
+# Point maps draw markers with tooltips, or raster tiles fetched per viewport from the local tile server
+map_modes = ["Markers", "Raster tiles"]
 
-# Load the household income dataset
-income_df = pd.read_csv(income_csv_path, encoding='ISO-8859-1')
-income_df = income_df[['states', 'Mean income (dollars)']]  # Keep only relevant columns
 
+# Food locations from cal.csv, shared by every section that shows them
+@st.fragment
+@instrumentation.fragment("food map")
+def show_food_map():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Food Locations Across California State</h2>",
+        unsafe_allow_html=True
+    )
+    # Display the map centered on Los Angeles, aggregating markers when zoomed out
+    if st.radio("Draw places as", map_modes, horizontal=True, key="food_map_mode") == "Raster tiles":
+        if point_maps.render_tile_map("cal", key="food_tile_map", location=[34.0522, -118.2437], zoom=11):
+            return
+    point_maps.render_point_map(
+        "cal",
+        key="food_map",
+        location=[34.0522, -118.2437],
+        zoom=11,
+        tooltip_fields=[("Name", "name"), ("Address", "address")],
+    )
 
-# Merge GeoJSON with household income data
-income_dict = dict(zip(income_df['states'], income_df['Mean income (dollars)']))
-for feature in us_states_geojson['features']:
-    state_name = feature['properties']['name']
-    feature['properties']['income'] = income_dict.get(state_name, 0)  # Default income to 0 if not found
 
+# Fast food outlets across the country from FastFoodRestaurants.csv, aggregated until zoomed in
+@st.fragment
+@instrumentation.fragment("outlet map")
+def show_outlet_map():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Fast Food Outlets Across the US</h2>",
+        unsafe_allow_html=True
+    )
+    if st.radio("Draw places as", map_modes, horizontal=True, key="outlet_map_mode") == "Raster tiles":
+        if point_maps.render_tile_map("fast_food", key="outlet_tile_map", location=[39.5, -98.35], zoom=4):
+            return
+    point_maps.render_point_map(
+        "fast_food",
+        key="outlet_map",
+        location=[39.5, -98.35],
+        zoom=4,
+        tooltip_fields=[("Name", "name"), ("Address", "address")],
+    )
 
 
-# Initialize to show the fast food map by default (Fast Food Chains visualization is selected by default)
-show_household_income = "Household Income"
+# Fitness centers and grocery shops from fitness_grocery.csv
+@st.fragment
+@instrumentation.fragment("fitness grocery map")
+def show_fitness_grocery_map():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Fitness Centers and Grocery Shops across Los Angeles</h2>",
+        unsafe_allow_html=True
+    )
+    if st.radio("Draw places as", map_modes, horizontal=True, key="fitness_map_mode") == "Raster tiles":
+        if point_maps.render_tile_map("fitness_grocery", key="fitness_tile_map", location=[34.0522, -118.2437], zoom=12):
+            return
+    point_maps.render_point_map(
+        "fitness_grocery",
+        key="fitness_map",
+        location=[34.0522, -118.2437],
+        zoom=12,
+        tooltip_fields=[("Name", "name"), ("Address", "address"), ("Type", "Type")],
+        icon_column="Type",
+        icon_mapping=type_icon_mapping,
+    )
 
 
-# Prepare the polygon layer
-for feature in us_states_geojson['features']:
-    state_name = feature['properties']['name']
-    state_count = state_row_counts[state_row_counts['province'] == state_name]['row_count'].values
-    feature['properties']['height'] = state_count[0] / 10 if len(state_count) > 0 else 0
-
-# Create the polygon layer for household income with new income ranges from 0 to 130,000 in increments of 15,000
-for feature in us_states_geojson['features']:
-    state_name = feature['properties']['name']
-    state_count = state_row_counts[state_row_counts['province'] == state_name]['row_count'].values
-    feature['properties']['height'] = state_count[0] / 10 if len(state_count) > 0 else 0
-    feature['properties']['height_n'] = feature['properties']['height']*10
-
-
-    # Clean the income value by removing commas
-    income = feature['properties']['income']
-    income = str(income).replace(',', '')  # Remove commas
-    income = int(income)  # Convert to integer after removing commas
-
-    # Color based on household income with new ranges from 0 to 130,000 (increments of 15,000)
-    if income <= 75000:
-        color = [247, 251, 255, 255]  # Darker color for income 60,001–75,000
-    elif income <= 90000:
-        color = [224, 236, 244, 255]  # Even darker for income 75,001–90,000
-    elif income <= 105000:
-        color = [158, 188, 218, 255]  # Darker blue for income 90,001–105,000
-    elif income <= 120000:
-        color = [110, 1, 107, 255]  # Darker blue for income 105,001–120,000
-    elif income <= 130000:
-        color = [77, 0, 75, 255]  # Deep blue for income 120,001–130,000
-    else:
-        color = [42, 0, 72, 255]  # For income above 130,000, keep black (or adjust as needed)
+# Spatial indexes over every point dataset, built once per set of source files
+@st.cache_resource
+def load_place_indexes(mtimes):
+    instrumentation.cache_miss()
+    places = prepared_store.load("places")
+    if places is None:
+        places = spatial_index.load_places()
+    return spatial_index.build_place_indexes(places)
 
-    feature['properties']['color'] = color
 
-    
-# Create the polygon layer for visualization
-polygon_layer = pdk.Layer(
-    "GeoJsonLayer",
-    us_states_geojson,
-    pickable=True,
-    stroked=False,
-    filled=True,
-    extruded=True,
-    get_fill_color="properties.color",
-    get_elevation="properties.height",
-    elevation_scale=10000,
-    wireframe=True,
-)
-
-
-# Set the initial view for the map
-view_state = pdk.ViewState(
-    longitude=-98.35, latitude=39.5, zoom=2.6,
-    pitch=80,         
-    bearing=-30
-)
-
-# Update the tooltip content based on the selected visualization
-tooltip_content = """
-<div style="background-color: #ffffcc; border-radius: 8px; padding: 10px; box-shadow: 0px 4px 8px rgba(0, 0, 0, 0.2); font-family: Arial, sans-serif; font-size: 12px;">
-    <b>{name}</b><br/>
-    {html_content}
-</div>
-"""
-tooltip_html = (
-    "Income: ${income}<br/>Density: {height_n}" 
-)
-tooltip = {
-    "html": tooltip_content.replace("{html_content}", tooltip_html),
-    "style": {
-        "color": "black",
-        "text-align": "center",
-        "font-weight": "bold",
-    },
+# Icons and colors for the nearby place categories
+category_icon_mapping = {
+    "fast food": {"icon": "cutlery", "color": "orange"},
+    "fitness": {"icon": "heartbeat", "color": "red"},
+    "grocery": {"icon": "shopping-cart", "color": "green"},
 }
 
-# Render the Deck.gl visualization
-deck = pdk.Deck(
-    layers=[polygon_layer],
-    initial_view_state=view_state,
-    tooltip=tooltip,
-    map_style="mapbox://styles/mapbox/light-v10",
-)
+
+# The nearest fast food, fitness and grocery places around a starting point
+@st.fragment
+@instrumentation.fragment("nearby places")
+def show_nearby_places():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Places Near Your Starting Point</h2>",
+        unsafe_allow_html=True
+    )
+    with instrumentation.span("load", "place indexes", cached=True):
+        place_indexes = load_place_indexes(data_prep.source_mtimes(*(path for path, _ in spatial_index.place_sources)))
+
+    lat_column, lon_column = st.columns(2)
+    origin_lat = lat_column.number_input("Latitude", value=34.0522, format="%.4f")
+    origin_lon = lon_column.number_input("Longitude", value=-118.2437, format="%.4f")
+    categories = st.multiselect("Show", list(place_indexes), default=list(place_indexes))
+    radius_km = st.slider("Search radius (km)", 1, 50, 5)
+    per_category = st.slider("Places per category", 1, 50, 10)
+
+    with instrumentation.span("transform", "nearby places query"):
+        places = spatial_index.nearby_places(place_indexes, origin_lat, origin_lon, per_category, radius_km, categories)
+    places["distance_km"] = places["distance_km"].round(2)
+
+    # A multi-stop trip through some of the places found, starting with the nearest of each category
+    stops = st.multiselect(
+        "Route stops",
+        places.index,
+        default=places.drop_duplicates("category").index,
+        format_func=lambda i: f"{places.at[i, 'name']} ({places.at[i, 'category']}, {places.at[i, 'distance_km']} km)",
+    )
+    mode_column, return_column = st.columns(2)
+    mode = mode_column.radio("Travel by", list(routing.mode_speeds_kmh), horizontal=True)
+    round_trip = return_column.checkbox("Return to the starting point", value=True)
+    with instrumentation.span("transform", "route plan"):
+        route_table, route = plan_route_table(places.loc[stops], origin_lat, origin_lon, mode, round_trip)
+
+    point_maps.render_places_map(
+        places,
+        key="nearby_map",
+        origin=[origin_lat, origin_lon],
+        zoom=int(max(3, min(16, 14 - math.log2(radius_km)))),
+        tooltip_fields=[("Name", "name"), ("Address", "address"), ("Distance (km)", "distance_km")],
+        icon_column="category",
+        icon_mapping=category_icon_mapping,
+        route=route,
+    )
+    if len(route_table):
+        st.caption(f"Route: {route_table['leg_km'].sum():.1f} km, about "
+                   f"{route_table['minutes'].iloc[-1]:.0f} minutes by {mode.lower()}")
+        st.dataframe(route_table, hide_index=True)
+    st.dataframe(places[["name", "address", "state", "category", "distance_km"]], hide_index=True)
+
+
+# The stops in visiting order with each leg's distance and the running travel time, and the route's points
+def plan_route_table(stops, origin_lat, origin_lon, mode, round_trip):
+    if not len(stops):
+        return pd.DataFrame(columns=["stop", "leg_km", "minutes"]), None
+    order, legs_km = routing.plan_route(
+        (origin_lat, origin_lon), tuple(zip(stops["latitude"], stops["longitude"])), round_trip)
+    route = stops.iloc[list(order)]
+    names = list(route["name"]) + (["Starting point"] if round_trip else [])
+    legs_km = np.asarray(legs_km)
+    table = pd.DataFrame({
+        "stop": names,
+        "leg_km": legs_km.round(2),
+        "minutes": routing.travel_minutes(legs_km, mode).cumsum().round(1),
+    })
+    points = [[origin_lat, origin_lon]] + route[["latitude", "longitude"]].values.tolist()
+    if round_trip:
+        points.append([origin_lat, origin_lon])
+    return table, points
+
+
+# Outlet density grids, computed once per resolution and smoothing setting
+@st.cache_data
+def load_density_grid(mtimes, cell_km, bandwidth):
+    instrumentation.cache_miss()
+    grids = prepared_store.load("outlet_grids")
+    if grids is not None and f"{cell_km}.keys" in grids:
+        return density.grid_from_counts(grids[f"{cell_km}.keys"], grids[f"{cell_km}.counts"], cell_km, "hex", bandwidth)
+    lat, lon = density.load_outlet_points(data_prep.csv_path)
+    return density.density_grid(lat, lon, cell_km, "hex", bandwidth)
+
+
+# Fast food outlets per equal-area hexagon, independent of state borders
+@st.fragment
+@instrumentation.fragment("outlet density")
+def show_outlet_density():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Fast Food Outlet Density</h2>",
+        unsafe_allow_html=True
+    )
+    cell_km = st.select_slider("Cell size (km)", options=[10, 25, 50, 100], value=50)
+    smoothed = st.checkbox("Smooth with a Gaussian kernel")
+    view = st.radio("Display as", ["Hexagon columns", "Heatmap"], horizontal=True)
+
+    with instrumentation.span("transform", "density grid", cached=True):
+        grid = load_density_grid(data_prep.source_mtimes(data_prep.csv_path), cell_km, 1.5 if smoothed else None)
+    value = "smoothed" if smoothed else "count"
+
+    # Only send the columns the layers use, dropping the faint smoothed tail and rounding to ~10 m
+    grid = grid.loc[grid[value] >= 0.5, ["longitude", "latitude"]].round(4).assign(outlets=grid[value].round(1))
+
+    if view == "Heatmap":
+        layer = pdk.Layer(
+            "HeatmapLayer",
+            grid,
+            get_position=["longitude", "latitude"],
+            get_weight="outlets",
+            radius_pixels=40,
+        )
+    else:
+        # Shade from light yellow to dark red by the share of the busiest cell
+        share = (grid["outlets"] / grid["outlets"].max()).to_numpy()[:, None]
+        grid["color"] = (np.array([255, 237, 160]) * (1 - share) + np.array([189, 0, 38]) * share).astype(int).tolist()
+        layer = pdk.Layer(
+            "ColumnLayer",
+            grid,
+            get_position=["longitude", "latitude"],
+            get_elevation="outlets",
+            elevation_scale=500000 / grid["outlets"].max(),
+            radius=cell_km * 1000 / math.sqrt(3),
+            disk_resolution=6,
+            extruded=True,
+            get_fill_color="color",
+            pickable=True,
+        )
+
+    with instrumentation.span("render", "density deck"):
+        st.pydeck_chart(pdk.Deck(
+            layers=[layer],
+            initial_view_state=pdk.ViewState(longitude=-98.35, latitude=39.5, zoom=3, pitch=45),
+            tooltip={"text": "{outlets} outlets"},
+            map_style="mapbox://styles/mapbox/light-v10",
+        ))
+
+
+# Extruded states whose height and color follow one value per state, on the low-to-high range
+def build_state_value_deck(state_shapes, states, values, low, high, value_name,
+                           low_color=health.low_color, high_color=health.high_color):
+    shares = np.nan_to_num((values - low) / ((high - low) or 1))
+    features = [
+        {**feature, "properties": {"name": state, "value": label, "color": color, "share": float(share)}}
+        for feature, state, label, color, share in zip(
+            state_shapes["features"], states, health.value_labels(values),
+            health.value_colors(values, low, high, low_color, high_color), shares,
+        )
+    ]
+    layer = pdk.Layer(
+        "GeoJsonLayer",
+        {"type": "FeatureCollection", "features": features},
+        pickable=True,
+        stroked=False,
+        filled=True,
+        extruded=True,
+        get_fill_color="properties.color",
+        get_elevation="properties.share",
+        elevation_scale=1000000,
+    )
+    return pdk.Deck(
+        layers=[layer],
+        initial_view_state=data_prep.view_state,
+        tooltip={"html": f"<b>{{name}}</b><br/>{value_name}: {{value}}"},
+        map_style="mapbox://styles/mapbox/light-v10",
+    )
+
+
+# Health outcome cubes over the states of the shared state geometry, built once per set of source files
+@st.cache_resource
+def load_health_cubes(mtimes):
+    instrumentation.cache_miss()
+    prepared = prepared_store.load("health_cubes")
+    if prepared is not None:
+        return prepared
+    states = [feature["properties"]["name"] for feature in load_state_shapes(state_shapes_mtime())["features"]]
+    return health.build_cubes(states)
+
+
+# Cache key of load_health_cubes
+def health_cubes_mtimes():
+    return data_prep.source_mtimes(data_prep.geojson_path, health.deaths_csv_path, health.obesity_csv_path)
+
+
+# Death rates and obesity by state, as a flat choropleth or extruded states
+@st.fragment
+@instrumentation.fragment("health map")
+def show_health_map():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Health Outcomes by State</h2>",
+        unsafe_allow_html=True
+    )
+    with instrumentation.span("load", "health cubes", cached=True):
+        cubes = load_health_cubes(health_cubes_mtimes())
+
+    measure_column, category_column = st.columns(2)
+    measure = measure_column.selectbox("Measure", list(cubes))
+    cube = cubes[measure]
+    category = category_column.selectbox("Cause or group", cube.categories)
+    year = cube.years[-1]
+    if len(cube.years) > 1:
+        year = st.select_slider("Year", options=cube.years, value=year)
+    view = st.radio("Display as", ["Choropleth", "Extruded states"], horizontal=True, key="health_view")
+
+    with instrumentation.span("transform", "health slice"):
+        values = cube.slice(year, category)
+        low, high = cube.value_range(category)
+
+    state_shapes = load_state_shapes(state_shapes_mtime())
+    if view == "Choropleth":
+        with instrumentation.span("build", "health choropleth"):
+            fig = px.choropleth(
+                locations=cube.states,
+                color=values,
+                geojson=state_shapes,
+                featureidkey='properties.name',
+                range_color=(low, high),
+                color_continuous_scale='YlOrRd',
+                labels={'color': measure, 'locations': 'State'},
+                title=f'{measure} - {category}, {year}',
+                scope='usa',
+            )
+            fig.update_geos(visible=True, projection_type="albers usa")
+        with instrumentation.span("render", "health choropleth"):
+            st.plotly_chart(fig, use_container_width=True)
+    else:
+        with instrumentation.span("build", "health deck"):
+            health_deck = build_state_value_deck(state_shapes, cube.states, values, low, high, measure)
+        with instrumentation.span("render", "health deck"):
+            st.pydeck_chart(health_deck)
+
+
+# Raw and standardized per-state features for the ranking, built once per set of source files
+@st.cache_resource
+def load_state_features(mtimes):
+    instrumentation.cache_miss()
+    features = prepared_store.load("state_features")
+    if features is None:
+        states = [feature["properties"]["name"] for feature in load_state_shapes(state_shapes_mtime())["features"]]
+        features = scoring.load_state_features(states, load_health_cubes(health_cubes_mtimes()))
+    return features, scoring.normalize_features(features)
+
+
+# Colors of the lowest and highest scoring states
+score_low_color = np.array([215, 48, 39])
+score_high_color = np.array([26, 152, 80])
+
+
+# States ranked by a weighted score of income, outlets, commuting and health, with weights from sliders
+@st.fragment
+@instrumentation.fragment("state ranking")
+def show_state_ranking():
+    st.markdown(
+        "<h2 style='font-size: 28px; font-weight: bold;'>Where to Live: Weighted State Ranking</h2>",
+        unsafe_allow_html=True
+    )
+    with instrumentation.span("load", "state features", cached=True):
+        features, normalized = load_state_features(data_prep.source_mtimes(
+            data_prep.csv_path, data_prep.geojson_path, data_prep.income_csv_path,
+            commute.commute_csv_path, health.deaths_csv_path, health.obesity_csv_path,
+        ))
+
+    with st.expander("Weights (drag below zero to prefer lower values)", expanded=True):
+        columns = st.columns(3)
+        weights = np.array([
+            columns[i % 3].slider(name, -1.0, 1.0, scoring.default_weights.get(name, 0.0), 0.05, key=f"weight {name}")
+            for i, name in enumerate(features.columns)
+        ])
+
+    with instrumentation.span("transform", "state scores"):
+        scores = scoring.score(normalized, weights)
+        order = np.argsort(-scores, kind="stable")
+
+    state_shapes = load_state_shapes(state_shapes_mtime())
+    with instrumentation.span("build", "score deck"):
+        score_deck = build_state_value_deck(
+            state_shapes, features.index, scores, scores.min(), scores.max(), "Score", score_low_color, score_high_color
+        )
+    with instrumentation.span("render", "score deck"):
+        st.pydeck_chart(score_deck)
+
+    ranking = features.iloc[order].round(2)
+    ranking.insert(0, "Score", scores[order].round(2))
+    ranking.insert(0, "Rank", np.arange(1, len(ranking) + 1))
+    st.dataframe(ranking, height=300)
+
+
+# The commute choropleth with every mode, built once per set of source files
+@st.cache_resource
+def build_commute_figure(mtimes):
+    instrumentation.cache_miss()
+    return commute.build_commute_figure(commute.load_commute_modes(), load_state_shapes(state_shapes_mtime()))
+
+
+# Commute mode shares by state on the shared state shapes; the mode buttons switch in the browser
+def show_commute_map():
+    st.header("USA Commute Modes Data")
+    with instrumentation.span("build", "commute choropleth", cached=True):
+        fig = build_commute_figure(data_prep.source_mtimes(commute.commute_csv_path, data_prep.geojson_path))
+    with instrumentation.span("render", "commute choropleth"):
+        st.plotly_chart(fig, use_container_width=True)
+
 
 # Streamlit application
 st.title("Life Plan Navigator A Data Visualization Journey")
@@ -172,6 +510,7 @@ if st.sidebar.button("Smart Route Planner"):
 
 # Display content based on the selected section stored in session state
 selected_section = getattr(st.session_state, "selected_section", "Food Locator")
+instrumentation.set_section(selected_section)
 
 
 
@@ -212,45 +551,16 @@ if selected_section == "Food Locator":
     )
 
     # Render the map
-    st.pydeck_chart(deck)
-    st.markdown(
-        "<h2 style='font-size: 28px; font-weight: bold;'>Food Locations Across California State</h2>",
-        unsafe_allow_html=True
-    )
-    @st.cache_data
-    def load_data(file_path):
-        return pd.read_csv(file_path)
-
-    # File path to the dataset
-    file_path = 'cal.csv'
-
-    # Load data
-    data = load_data(file_path)
-
-    # Validate necessary columns
-    required_columns = ["latitude", "longitude", "address", "name"]
-    if not all(col in data.columns for col in required_columns):
-        st.error(f"The dataset must contain the following columns: {', '.join(required_columns)}")
-
-    # Create a base map centered on California
-    # california_map = folium.Map(location=[37.5, -119.5], zoom_start=6)
-    california_map = folium.Map(location=[34.0522, -118.2437], zoom_start=11)
-
-    # Add individual markers to the map
-    for _, row in data.iterrows():
-        tooltip_text = f"Name: {row['name']}<br>Address: {row['address']}"  # Combine name and address
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=tooltip_text,  # Popup to show details
-            tooltip=tooltip_text  # Tooltip for hover
-        ).add_to(california_map)
-
-    # Display the map
-    st_folium(california_map, width=800, height=600)
+    with instrumentation.span("render", "state deck"):
+        st.pydeck_chart(deck)
+    show_outlet_density()
+    show_outlet_map()
+    show_food_map()
 
     
 elif selected_section == "Best Place to Live":
     st.title("Best Place to Live")
+    show_state_ranking()
     st.markdown(
         "<h2 style='font-size: 23px; font-weight: bold;'>Height - Food Outlet Density<br>Color gradient - Annual Household Income</h2>",
         unsafe_allow_html=True
@@ -285,235 +595,33 @@ elif selected_section == "Best Place to Live":
     )
 
     # Render the map
-    st.pydeck_chart(deck)
-    st.markdown(
-    "<h2 style='font-size: 28px; font-weight: bold;'>Food Locations Across California State</h2>",
-    unsafe_allow_html=True
-    )
-    @st.cache_data
-    def load_data(file_path):
-        return pd.read_csv(file_path)
-
-    # File path to the dataset
-    file_path = 'cal.csv'
-
-    # Load data
-    data = load_data(file_path)
-
-    # Validate necessary columns
-    required_columns = ["latitude", "longitude", "address", "name"]
-    if not all(col in data.columns for col in required_columns):
-        st.error(f"The dataset must contain the following columns: {', '.join(required_columns)}")
-
-    # Create a base map centered on California
-    # california_map = folium.Map(location=[37.5, -119.5], zoom_start=6)
-    california_map = folium.Map(location=[34.0522, -118.2437], zoom_start=11)
-
-    # Add individual markers to the map
-    for _, row in data.iterrows():
-        tooltip_text = f"Name: {row['name']}<br>Address: {row['address']}"  # Combine name and address
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=tooltip_text,  # Popup to show details
-            tooltip=tooltip_text  # Tooltip for hover
-        ).add_to(california_map)
-
-    # Display the map
-    st_folium(california_map, width=800, height=600)
+    with instrumentation.span("render", "state deck"):
+        st.pydeck_chart(deck)
+    show_health_map()
+    show_food_map()
 
 
     # Code for Fitness centers and groceries
-    # Load the CSV file
-    @st.cache_data
-    def load_data(file_path):
-        return pd.read_csv(file_path, encoding='ISO-8859-1')
-
-    st.markdown(
-        "<h2 style='font-size: 28px; font-weight: bold;'>Fitness Centers and Grocery Shops across Los Angeles</h2>",
-        unsafe_allow_html=True
-    )
-
-    # File path to the dataset
-    file_path = 'fitness_grocery.csv'
-
-    # Load data
-    data = load_data(file_path)
-    data = data.dropna(subset=['latitude', 'Type'])  # Ensure 'Type' is not missing
-
-    # Validate necessary columns
-    required_columns = ["latitude", "longitude", "address", "name", "Type"]
-    if not all(col in data.columns for col in required_columns):
-        st.error(f"The dataset must contain the following columns: {', '.join(required_columns)}")
-
-    # Create a base map centered on California
-    # california_map = folium.Map(location=[37.5, -119.5], zoom_start=6)
-    california_map = folium.Map(location=[34.0522, -118.2437], zoom_start=12)
-    
-    # Define a mapping for Types to icons and colors
-    type_icon_mapping = {
-        "fitness": {"icon": "heartbeat", "color": "red"},
-        "grocery": {"icon": "shopping-cart", "color": "green"},
-    }
-
-    # Add individual markers to the map
-    for _, row in data.iterrows():
-        tooltip_text = f"Name: {row['name']}<br>Address: {row['address']}<br>Type: {row['Type']}"  # Include type info
-        
-        # Get the icon and color for the type
-        icon_info = type_icon_mapping.get(row["Type"].lower(), {"icon": "info-sign", "color": "blue"})  # Default icon
-        
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=tooltip_text,
-            tooltip=tooltip_text,
-            icon=folium.Icon(icon=icon_info["icon"], color=icon_info["color"])
-        ).add_to(california_map)
-
-    # Display the map
-    st_folium(california_map, width=800, height=600)
+    show_fitness_grocery_map()
 
 elif selected_section == "Smart Route Planner":
     st.title("Smart Route Planner")
-    st.markdown(
-        "<h2 style='font-size: 28px; font-weight: bold;'>Food Locations Across California State</h2>",
-        unsafe_allow_html=True
-    )
-    @st.cache_data
-    def load_data(file_path):
-        return pd.read_csv(file_path)
-
-    # File path to the dataset
-    file_path = 'cal.csv'
-
-    # Load data
-    data = load_data(file_path)
-
-    # Validate necessary columns
-    required_columns = ["latitude", "longitude", "address", "name"]
-    if not all(col in data.columns for col in required_columns):
-        st.error(f"The dataset must contain the following columns: {', '.join(required_columns)}")
-
-    # Create a base map centered on California
-    # california_map = folium.Map(location=[37.5, -119.5], zoom_start=6)
-    california_map = folium.Map(location=[34.0522, -118.2437], zoom_start=11)
+    show_nearby_places()
 
-    # Add individual markers to the map
-    for _, row in data.iterrows():
-        tooltip_text = f"Name: {row['name']}<br>Address: {row['address']}"  # Combine name and address
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=tooltip_text,  # Popup to show details
-            tooltip=tooltip_text  # Tooltip for hover
-        ).add_to(california_map)
-
-    # Display the map
-    st_folium(california_map, width=800, height=600)
-
-
-    # Code for Fitness centers and groceries
-    # Load the CSV file
-    @st.cache_data
-    def load_data(file_path):
-        return pd.read_csv(file_path, encoding='ISO-8859-1')
-
-    st.markdown(
-        "<h2 style='font-size: 28px; font-weight: bold;'>Fitness Centers and Grocery Shops across Los Angeles</h2>",
-        unsafe_allow_html=True
-    )
-
-    # File path to the dataset
-    file_path = 'fitness_grocery.csv'
-
-    # Load data
-    data = load_data(file_path)
-    data = data.dropna(subset=['latitude', 'Type'])  # Ensure 'Type' is not missing
-
-    # Validate necessary columns
-    required_columns = ["latitude", "longitude", "address", "name", "Type"]
-    if not all(col in data.columns for col in required_columns):
-        st.error(f"The dataset must contain the following columns: {', '.join(required_columns)}")
-
-    # Create a base map centered on California
-    # california_map = folium.Map(location=[37.5, -119.5], zoom_start=6)
-    california_map = folium.Map(location=[34.0522, -118.2437], zoom_start=12)
-    
-    # Define a mapping for Types to icons and colors
-    type_icon_mapping = {
-        "fitness": {"icon": "heartbeat", "color": "red"},
-        "grocery": {"icon": "shopping-cart", "color": "green"},
-    }
-
-    # Add individual markers to the map
-    for _, row in data.iterrows():
-        tooltip_text = f"Name: {row['name']}<br>Address: {row['address']}<br>Type: {row['Type']}"  # Include type info
-        
-        # Get the icon and color for the type
-        icon_info = type_icon_mapping.get(row["Type"].lower(), {"icon": "info-sign", "color": "blue"})  # Default icon
-        
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=tooltip_text,
-            tooltip=tooltip_text,
-            icon=folium.Icon(icon=icon_info["icon"], color=icon_info["color"])
-        ).add_to(california_map)
-
-    # Display the map
-    st_folium(california_map, width=800, height=600)
-
-    # Load the dataset
-    df = pd.read_csv('us_commuting_modes.csv')
-
-    # Load the GeoJSON data for US states
-    geo_df = gpd.read_file('us-states.json')
-
-    # Rename columns if necessary
-    geo_df = geo_df.rename(columns={'name': 'State'})
-
-    # Merge the GeoDataFrame with the dataset based on state name
-    merged_df = geo_df.merge(df, on='State', how='left')
-
-
-    # Display the dataset as a table in Streamlit
-    st.header("USA Commute Modes Data")
-
-
-    # Add a dropdown or radio button to select the commuting mode
-    selected_mode = st.radio("Select a commuting mode to visualize:", ['Car', 'Bike', 'Public Transport', 'Walking'])
-
-    # Set color schemes for each mode
-    color_schemes = {
-        'Car': 'Reds',
-        'Bike': 'Blues',
-        'Public Transport': 'Greens',
-        'Walking': 'Purples'
-    }
-
-    # Determine the appropriate color scheme based on the selected mode
-    color_scheme = color_schemes[selected_mode]
-
-    # Create a Plotly map with the selected commuting mode
-    fig = px.choropleth(
-        merged_df,
-        geojson=geo_df.geometry,
-        locations=merged_df.index,
-        color=f'{selected_mode} (%)',
-        hover_name='State',
-        hover_data=['Bike (%)', 'Car (%)', 'Public Transport (%)', 'Walking (%)'],
-        title=f'US Commute Modes - {selected_mode} Commuting Percentage',
-        color_continuous_scale=color_scheme,
-        scope='usa'
-    )
-
-    # Update the map layout
-    fig.update_geos(
-        visible=True,
-        projection_type="albers usa"
-    )
-    # st.dataframe(df)
-    # Display the map in Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    show_commute_map()
 
 else:
     # Default content if no section is selected
     st.title("Welcome")
     st.write("Use the sidebar to navigate to different sections.")
+
+# Close this run's timings; the optional panel shows them with first-run vs warm percentiles.
+# Set METRICS_JSONL to append every run as a JSON line, or METRICS_PORT to serve /metrics.
+rerun = instrumentation.finish_rerun()
+if st.sidebar.checkbox("Show performance panel"):
+    st.sidebar.caption(f"This run: {rerun['total_ms']:.0f} ms, {rerun['rss_mb']} MB resident")
+    st.sidebar.dataframe(pd.DataFrame(rerun["spans"], columns=["stage", "name", "ms", "cache", "memory_delta_kb"]),
+                         hide_index=True)
+    st.sidebar.dataframe(pd.DataFrame(instrumentation.summary()), hide_index=True)
+    if warm_start_report:
+        st.sidebar.text(f"Warm start\n{warm_start_report}")
@@ -0,0 +1,303 @@
+import math
+import os
+import urllib.parse
+
+import folium
+import numpy as np
+import streamlit as st
+from streamlit_folium import st_folium
+
+import columnar_cache
+import instrumentation
+import tile_server
+
+# Point datasets shown on the folium maps
+datasets = {
+    "cal": {
+        "path": "cal.csv",
+        "dropna": None,
+        "required_columns": ["latitude", "longitude", "address", "name"],
+    },
+    "fitness_grocery": {
+        "path": "fitness_grocery.csv",
+        "dropna": ["latitude", "Type"],  # Ensure 'Type' is not missing
+        "required_columns": ["latitude", "longitude", "address", "name", "Type"],
+    },
+    "fast_food": {
+        "path": "FastFoodRestaurants.csv",
+        "dropna": ["latitude", "longitude"],
+        "required_columns": ["latitude", "longitude", "address", "name"],
+    },
+}
+
+# Zoom level from which individual markers are always drawn
+marker_zoom = 14
+
+# Individual markers are also drawn when no more than this many points are in view
+marker_limit = 500
+
+# Approximate size of one aggregated grid cell on screen, in pixels
+cell_pixels = 64
+
+
+# Load a point dataset once per file version, shared by every section that maps it
+@st.cache_data
+def load_dataset(name, mtime):
+    instrumentation.cache_miss()
+    spec = datasets[name]
+    data = columnar_cache.read_table(spec["path"], columns=spec["required_columns"])
+    if spec["dropna"]:
+        data = data.dropna(subset=spec["dropna"])
+    return data
+
+
+# Width of one grid cell in degrees of longitude at the given zoom level
+def grid_cell_size(zoom):
+    return 360 / 2 ** zoom * cell_pixels / 256
+
+
+# Estimate the visible bounds of a map from its center, zoom and size in pixels
+def viewport_bounds(center, zoom, width, height):
+    degrees_per_pixel = 360 / (256 * 2 ** zoom)
+    half_lon = width / 2 * degrees_per_pixel
+    half_lat = height / 2 * degrees_per_pixel * math.cos(math.radians(center[0]))
+    return [[center[0] - half_lat, center[1] - half_lon], [center[0] + half_lat, center[1] + half_lon]]
+
+
+# Mask of the points that fall inside [[south, west], [north, east]] bounds
+def points_in_bounds(lat, lon, bounds):
+    (south, west), (north, east) = bounds
+    return (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+
+
+# Aggregate points into square grid cells, returning each cell's centroid and point count
+def aggregate_points(lat, lon, zoom):
+    size = grid_cell_size(zoom)
+    cells = np.stack([np.floor(lat / size), np.floor(lon / size)], axis=1)
+    _, cell_index, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cell_index = cell_index.ravel()
+    cell_lat = np.bincount(cell_index, weights=lat) / counts
+    cell_lon = np.bincount(cell_index, weights=lon) / counts
+    return cell_lat, cell_lon, counts
+
+
+# Build the "Label: value<br>Label: value" tooltip for every row in one column pass
+def tooltip_texts(data, tooltip_fields):
+    texts = None
+    for label, column in tooltip_fields:
+        part = f"{label}: " + data[column].astype(str)
+        texts = part if texts is None else texts + "<br>" + part
+    return texts.to_numpy()
+
+
+# Snap viewport bounds outward to a coarse grid, padded by half the viewport on every side,
+# so small pans map onto the same cached layer
+def query_bounds(bounds, zoom):
+    (south, west), (north, east) = bounds
+    pad_lat, pad_lon = (north - south) / 2, (east - west) / 2
+    snap = grid_cell_size(zoom) * 4
+    return (
+        (math.floor((south - pad_lat) / snap) * snap, math.floor((west - pad_lon) / snap) * snap),
+        (math.ceil((north + pad_lat) / snap) * snap, math.ceil((east + pad_lon) / snap) * snap),
+    )
+
+
+# Turn coordinate arrays and per-point properties into a GeoJSON FeatureCollection
+def feature_collection(lat, lon, **properties):
+    columns = list(properties)
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [point_lon, point_lat]},
+            "properties": dict(zip(columns, values)),
+        }
+        for point_lat, point_lon, *values in zip(lat.tolist(), lon.tolist(), *(properties[column] for column in columns))
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+# Compute the GeoJSON for one viewport of a point dataset.
+# Zoomed out views get one circle per grid cell; zoomed in views get individual markers grouped by icon.
+@st.cache_data(max_entries=256)
+def point_layer_data(name, mtime, zoom, bounds, tooltip_fields, icon_column=None):
+    instrumentation.cache_miss()
+    return viewport_layer_data(load_dataset(name, mtime), zoom, bounds, tooltip_fields, icon_column)
+
+
+def viewport_layer_data(data, zoom, bounds, tooltip_fields, icon_column=None):
+    lat = data['latitude'].to_numpy(dtype=float)
+    lon = data['longitude'].to_numpy(dtype=float)
+    in_view = points_in_bounds(lat, lon, bounds)
+
+    if zoom < marker_zoom and in_view.sum() > marker_limit:
+        cell_lat, cell_lon, counts = aggregate_points(lat[in_view], lon[in_view], zoom)
+        return {"clusters": feature_collection(
+            cell_lat,
+            cell_lon,
+            radius=(6 + 3 * np.log2(counts)).tolist(),
+            tooltip=[f"{count} places" for count in counts.tolist()],
+        )}
+
+    return marker_layer_data(data[in_view], tooltip_fields, icon_column)
+
+
+# GeoJSON for individual markers, one FeatureCollection per icon group
+def marker_layer_data(data, tooltip_fields, icon_column=None):
+    lat = data['latitude'].to_numpy(dtype=float)
+    lon = data['longitude'].to_numpy(dtype=float)
+    texts = tooltip_texts(data, tooltip_fields)
+    if icon_column is None:
+        groups = np.full(len(data), "")
+    else:
+        groups = data[icon_column].astype(str).str.lower().to_numpy()
+
+    markers = {}
+    for group in np.unique(groups):
+        mask = groups == group
+        markers[group] = feature_collection(lat[mask], lon[mask], tooltip=texts[mask].tolist())
+    return {"markers": markers}
+
+
+# Build the folium layer for cached viewport GeoJSON, with one tooltip template per layer instead of per marker
+def build_point_layer(layer_data, icon_mapping=None):
+    layer = folium.FeatureGroup(name="points")
+    if "clusters" in layer_data:
+        if layer_data["clusters"]["features"]:
+            folium.GeoJson(
+                layer_data["clusters"],
+                marker=folium.CircleMarker(color="#3186cc", fill=True, fill_opacity=0.6),
+                style_function=lambda feature: {"radius": feature["properties"]["radius"]},
+                tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False),
+            ).add_to(layer)
+        return layer
+
+    for group, collection in layer_data["markers"].items():
+        if icon_mapping is None:
+            marker = folium.Marker()
+        else:
+            # Get the icon and color for the type, with a default icon for unknown types
+            icon_info = icon_mapping.get(group, {"icon": "info-sign", "color": "blue"})
+            marker = folium.Marker(icon=folium.Icon(icon=icon_info["icon"], color=icon_info["color"]))
+        folium.GeoJson(
+            collection,
+            marker=marker,
+            tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False),  # Tooltip for hover
+            popup=folium.GeoJsonPopup(fields=["tooltip"], labels=False),  # Popup to show details
+        ).add_to(layer)
+    return layer
+
+
+# Read the last viewport the browser reported for a map, falling back to its initial view
+def current_view(key, location, zoom, width, height):
+    state = st.session_state.get(key) or {}
+    center = state.get("center") or {}
+    bounds = state.get("bounds") or {}
+    if state.get("zoom") is not None:
+        zoom = state["zoom"]
+    if center.get("lat") is not None:
+        location = [center["lat"], center["lng"]]
+    south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    if south_west.get("lat") is not None and north_east.get("lat") is not None:
+        bounds = [[south_west["lat"], south_west["lng"]], [north_east["lat"], north_east["lng"]]]
+    else:
+        bounds = viewport_bounds(location, zoom, width, height)
+    return location, zoom, bounds
+
+
+# Render a point dataset on a folium map that only draws what the viewport needs.
+# Panning or zooming reruns the app with the new viewport; the layer for each snapped viewport is cached,
+# so switching sections or rerunning for another widget reuses it instead of rebuilding every marker.
+def render_point_map(name, key, location, zoom, tooltip_fields, icon_column=None, icon_mapping=None,
+                     width=800, height=600):
+    spec = datasets[name]
+    mtime = os.path.getmtime(spec["path"])
+
+    # Validate necessary columns
+    with instrumentation.span("load", f"{name} dataset", cached=True):
+        data = load_dataset(name, mtime)
+    if not all(col in data.columns for col in spec["required_columns"]):
+        st.error(f"The dataset must contain the following columns: {', '.join(spec['required_columns'])}")
+        return None
+
+    view_location, view_zoom, bounds = current_view(key, location, zoom, width, height)
+    with instrumentation.span("transform", f"{name} viewport layer", cached=True):
+        layer_data = point_layer_data(
+            name, mtime, view_zoom, query_bounds(bounds, view_zoom), tuple(tooltip_fields), icon_column
+        )
+    with instrumentation.span("build", f"{name} folium map"):
+        base_map = folium.Map(location=location, zoom_start=zoom)
+        layer = build_point_layer(layer_data, icon_mapping)
+    with instrumentation.span("render", f"{name} folium map"):
+        return st_folium(
+            base_map,
+            key=key,
+            width=width,
+            height=height,
+            center=view_location,
+            zoom=view_zoom,
+            feature_group_to_add=layer,
+            returned_objects=["zoom", "center", "bounds"],
+        )
+
+
+# Why this browser can not load tiles from the tile endpoint, or None when it can
+def tile_endpoint_problem():
+    if not tile_server.start_tile_server():
+        return (f"Another program holds the tile port {tile_server.tile_port}; "
+                "set TILE_PORT to a free one.")
+    if tile_server.tile_url is None:
+        browser_host = urllib.parse.urlsplit(f"//{st.context.headers.get('Host', 'localhost')}").hostname
+        if browser_host not in ("localhost", "127.0.0.1", "::1"):
+            return "Raster tiles on a remote deployment need TILE_URL set to the tile endpoint's public address."
+    elif (st.context.url or "").startswith("https:") and tile_server.tile_url.startswith("http:"):
+        return "This page is served over https, so TILE_URL must be an https address too."
+    return None
+
+
+# Render a point layer as raster tiles from the local tile server instead of inline markers.
+# The page only carries the tile URL; the browser fetches the tiles in view as the map moves,
+# and the map does not report interactions back, so panning never triggers a rerun.
+# Returns False, after a warning, when the browser could not load the tiles.
+def render_tile_map(layer, key, location, zoom, width=800, height=600):
+    problem = tile_endpoint_problem()
+    if problem is not None:
+        st.warning(f"{problem} Showing markers instead.")
+        return False
+    with instrumentation.span("build", f"{layer} tile map"):
+        base_map = folium.Map(location=location, zoom_start=zoom)
+        folium.TileLayer(
+            tiles=tile_server.tile_url_template(layer),
+            attr="Local point tiles",
+            name=layer,
+            overlay=True,
+            max_zoom=19,
+        ).add_to(base_map)
+    with instrumentation.span("render", f"{layer} tile map"):
+        st_folium(base_map, key=key, width=width, height=height, returned_objects=[])
+    return True
+
+
+# Render a small set of places, such as query results, around an origin marker.
+# The map does not report interactions back, so it never triggers a rerun.
+def render_places_map(data, key, origin, zoom, tooltip_fields, icon_column=None, icon_mapping=None,
+                      width=800, height=600, route=None):
+    with instrumentation.span("build", f"{key} folium map"):
+        layer = build_point_layer(marker_layer_data(data, tooltip_fields, icon_column), icon_mapping)
+        folium.Marker(
+            location=origin,
+            tooltip="Starting point",
+            icon=folium.Icon(icon="home", color="black"),
+        ).add_to(layer)
+        if route:
+            folium.PolyLine(route, color="blue", weight=4, opacity=0.7).add_to(layer)
+        base_map = folium.Map(location=origin, zoom_start=zoom)
+    with instrumentation.span("render", f"{key} folium map"):
+        return st_folium(
+            base_map,
+            key=key,
+            width=width,
+            height=height,
+            center=origin,
+            feature_group_to_add=layer,
+            returned_objects=[],
+        )
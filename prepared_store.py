@@ -0,0 +1,300 @@
+import argparse
+import contextlib
+import copy
+import fcntl
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pyarrow as pa
+
+import columnar_cache
+import commute
+import data_prep
+import density
+import geometry
+import health
+import region_index
+import scoring
+import spatial_index
+import stream_ingest
+import task_graph
+
+# Directory holding the prepared builds and the pointer to the current one
+store_dir = os.path.join(columnar_cache.cache_dir, 'prepared')
+pointer_path = os.path.join(store_dir, 'current')
+lock_path = os.path.join(store_dir, 'build.lock')
+
+# Modules whose code builds the prepared artifacts, including columnar_cache's normalizers
+builder_modules = [
+    columnar_cache, commute, data_prep, density, geometry, health, region_index, scoring, spatial_index,
+    stream_ingest, task_graph,
+]
+
+# Source files the prepared data is built from, and the code that builds and writes it;
+# a build is only used while none of them changed
+source_paths = list(dict.fromkeys([
+    data_prep.geojson_path,
+    *columnar_cache.sources,
+    *(os.path.relpath(module.__file__) for module in builder_modules),
+    os.path.relpath(__file__),
+]))
+
+# Builds kept besides the current one, for replicas still reading the previous build
+keep_previous = 1
+
+_manifests = {}
+
+
+def source_mtimes():
+    return {path: os.path.getmtime(path) for path in source_paths}
+
+
+# Writers and readers per artifact kind.
+# Arrays and tables are memory-mapped on read, so every replica shares the page cache instead of a private copy.
+# Table columns stay in the mapped Arrow buffers: numbers as NumPy views, strings as Arrow-backed pandas strings.
+# Only categorical codes are copied.
+def write_json(directory, name, value):
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump(value, f)
+    return {}
+
+
+def read_json(directory, name, meta):
+    with open(os.path.join(directory, f'{name}.json')) as f:
+        return json.load(f)
+
+
+def write_arrays(directory, name, arrays):
+    for key, values in arrays.items():
+        np.save(os.path.join(directory, f'{name}.{key}.npy'), np.ascontiguousarray(values))
+    return {'keys': list(arrays)}
+
+
+def read_arrays(directory, name, meta):
+    return {key: np.load(os.path.join(directory, f'{name}.{key}.npy'), mmap_mode='r') for key in meta['keys']}
+
+
+def write_table(directory, name, df):
+    table = pa.Table.from_pandas(df)
+    # Keep NaN as a float value: a column with nulls has to be copied to fill them in on read
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type) and table.column(i).null_count:
+            table = table.set_column(i, field, pa.array(df[field.name].to_numpy(), type=field.type, from_pandas=False))
+    with pa.OSFile(os.path.join(directory, f'{name}.arrow'), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return {}
+
+
+def read_table(directory, name, meta):
+    with pa.memory_map(os.path.join(directory, f'{name}.arrow')) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+def write_cubes(directory, name, cubes):
+    axes = {}
+    for i, (measure, cube) in enumerate(cubes.items()):
+        np.save(os.path.join(directory, f'{name}.{i}.npy'), cube.values)
+        axes[measure] = {'states': cube.states, 'years': cube.years, 'categories': cube.categories}
+    return {'axes': axes}
+
+
+def read_cubes(directory, name, meta):
+    return {
+        measure: health.HealthCube(
+            np.load(os.path.join(directory, f'{name}.{i}.npy'), mmap_mode='r'),
+            axes['states'], axes['years'], axes['categories'],
+        )
+        for i, (measure, axes) in enumerate(meta['axes'].items())
+    }
+
+
+artifact_kinds = {
+    'json': (write_json, read_json),
+    'arrays': (write_arrays, read_arrays),
+    'table': (write_table, read_table),
+    'cubes': (write_cubes, read_cubes),
+}
+
+
+def state_names(state_shapes):
+    return [feature['properties']['name'] for feature in state_shapes['features']]
+
+
+def join_state_geojson(state_shapes, outlets, income_df):
+    return data_prep.join_state_properties(copy.deepcopy(state_shapes), outlets['state_row_counts'], income_df)
+
+
+def flatten_outlet_grids(outlets):
+    grids = {}
+    for cell_km, (keys, counts) in outlets['grids'].items():
+        grids[f'{cell_km}.keys'] = keys
+        grids[f'{cell_km}.counts'] = counts
+    return grids
+
+
+# Dependency graph of the preparation, as {task: (fn, dependencies)} for task_graph.run_graph.
+# Every source CSV is parsed into the columnar cache by its own task, so the parses run side by side.
+def preparation_tasks():
+    tasks = {f'parse {path}': (lambda path=path: columnar_cache.ensure_cached(path), []) for path in columnar_cache.sources}
+    tasks.update({
+        'us_states': (data_prep.load_us_states, []),
+        'state_shapes': (
+            lambda us_states: geometry.simplify_geojson(us_states, geometry.tolerance_for_zoom(geometry.state_map_zoom)),
+            ['us_states'],
+        ),
+        # The outlet feed is streamed in chunks, so its size does not bound the build's memory
+        'outlets': (lambda: stream_ingest.aggregate_outlets(data_prep.csv_path), []),
+        'income': (lambda _: data_prep.load_income(), [f'parse {data_prep.income_csv_path}']),
+        'state_geojson': (join_state_geojson, ['state_shapes', 'outlets', 'income']),
+        'health_cubes': (
+            lambda state_shapes, *_: health.build_cubes(state_names(state_shapes)),
+            ['state_shapes', f'parse {health.deaths_csv_path}', f'parse {health.obesity_csv_path}'],
+        ),
+        'state_features': (
+            lambda state_shapes, cubes, outlets, *_: scoring.load_state_features(
+                state_names(state_shapes), cubes, outlets['state_row_counts']),
+            ['state_shapes', 'health_cubes', 'outlets', f'parse {data_prep.income_csv_path}',
+             f'parse {commute.commute_csv_path}'],
+        ),
+        'outlet_grids': (flatten_outlet_grids, ['outlets']),
+        'places': (
+            lambda *_: spatial_index.load_places(),
+            [f'parse {path}' for path, _ in spatial_index.place_sources],
+        ),
+    })
+    return tasks
+
+
+# Kind of each artifact written to the store
+artifacts = {
+    'state_shapes': 'json',
+    'state_geojson': 'json',
+    'health_cubes': 'cubes',
+    'state_features': 'table',
+    'outlet_grids': 'arrays',
+    'places': 'table',
+}
+
+
+# Everything the app prepares from the sources, as {name: (kind, value)}, and the task timings
+def prepare_artifacts(max_workers=None):
+    tasks = preparation_tasks()
+    results, timings = task_graph.run_graph(tasks, max_workers)
+    return {artifact: (kind, results[artifact]) for artifact, kind in artifacts.items()}, timings
+
+
+# Exclusive lock on the store while a build runs; the kernel drops it if the process dies.
+# Yields False instead of waiting when wait is False and another process holds it.
+@contextlib.contextmanager
+def build_lock(wait=True):
+    os.makedirs(store_dir, exist_ok=True)
+    with open(lock_path, 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Build every artifact into a fresh directory, then point the store at it.
+# Readers never see a partial build: the directory is complete before the pointer is replaced.
+# One build runs at a time; with wait=False this returns None when another process is building.
+# Returns the build directory and the preparation task timings.
+def build(max_workers=None, wait=True):
+    with build_lock(wait) as locked:
+        if not locked:
+            return None
+        mtimes = source_mtimes()
+        name = f"build-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        directory = os.path.join(store_dir, name)
+        os.makedirs(directory)
+        try:
+            prepared, timings = prepare_artifacts(max_workers)
+            written = {}
+            for artifact, (kind, value) in prepared.items():
+                write, _ = artifact_kinds[kind]
+                written[artifact] = {'kind': kind, **write(directory, artifact, value)}
+            with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+                json.dump({'sources': mtimes, 'artifacts': written}, f)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        temp_path = f"{pointer_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(name)
+        os.replace(temp_path, pointer_path)
+        remove_old_builds(name)
+    return directory, timings
+
+
+# Remove finished builds older than the current one, keeping the newest keep_previous of them.
+# Builds without a manifest are unfinished or failed, and are left alone.
+def remove_old_builds(current):
+    def finished(entry):
+        manifest_path = os.path.join(store_dir, entry, 'manifest.json')
+        return os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+
+    current_finished = finished(current)
+    builds = sorted(
+        (finished(entry), entry) for entry in os.listdir(store_dir)
+        if entry.startswith('build-') and entry != current and finished(entry) is not None
+    )
+    older = [entry for finished_at, entry in builds if finished_at <= current_finished]
+    for entry in older[:max(0, len(older) - keep_previous)]:
+        shutil.rmtree(os.path.join(store_dir, entry), ignore_errors=True)
+
+
+# The current build's directory and manifest, or None when there is no build or its sources changed
+def current_build():
+    try:
+        with open(pointer_path) as f:
+            directory = os.path.join(store_dir, f.read().strip())
+        if directory not in _manifests:
+            with open(os.path.join(directory, 'manifest.json')) as f:
+                _manifests[directory] = json.load(f)
+    except OSError:
+        return None
+    manifest = _manifests[directory]
+    if manifest['sources'] != source_mtimes():
+        return None
+    return directory, manifest
+
+
+# A prepared artifact from the current build, or None so the caller prepares it itself
+def load(artifact):
+    build = current_build()
+    if build is None:
+        return None
+    directory, manifest = build
+    meta = manifest['artifacts'].get(artifact)
+    if meta is None:
+        return None
+    _, read = artifact_kinds[meta['kind']]
+    return read(directory, artifact, meta)
+
+
+# Warmup command: build the store once, before starting the replicas
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the prepared data shared by the app replicas")
+    parser.add_argument('--workers', type=int, help="preparation threads (default: one per CPU)")
+    parser.add_argument('--cold', action='store_true', help="rebuild the Parquet caches of the sources too")
+    args = parser.parse_args()
+
+    if args.cold:
+        # Only the Parquet caches: replicas may be reading the prepared builds, and the build lock must stay in place
+        for csv_path in columnar_cache.sources:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(columnar_cache.cache_path(csv_path))
+    start = time.perf_counter()
+    directory, timings = build(args.workers)
+    print(f"Built {directory} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(task_graph.report(preparation_tasks(), timings))
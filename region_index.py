@@ -0,0 +1,115 @@
+import functools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+# GeoJSON with the state polygons points are assigned to
+state_geojson_path = 'us-states.json'
+
+# Grid cell size in degrees of the first pass: every point of a cell lying inside one region
+# is assigned without testing it against a polygon
+cell_degrees = 0.25
+
+# The state shapes are coarse along the coasts; points this close to a region (in degrees, ~50 km)
+# but outside all of them, such as piers, small islands and the Florida Keys, go to the nearest one
+snap_degrees = 0.5
+
+
+# Point-in-polygon index over the features of a GeoJSON FeatureCollection, named by a feature property.
+# An STRtree finds the regions each grid cell touches, and only points in cells crossed by a border are
+# tested against the (prepared) polygons, so the cost is one pass over the points plus the border cells.
+class RegionIndex:
+    def __init__(self, geojson, name_property='name'):
+        features = geojson['features']
+        self.names = [feature['properties'][name_property] for feature in features]
+        self.geometries = np.array([shape(feature['geometry']) for feature in features])
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.columns = int(360 / cell_degrees) + 1
+
+    # Position in self.names of the region each point falls in, -1 far from every region or without coordinates
+    def assign(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        regions = np.full(len(lat), -1, dtype=np.int32)
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        lat, lon = lat[valid], lon[valid]
+
+        rows = np.floor(lat / cell_degrees).astype(np.int64)
+        columns = np.floor(lon / cell_degrees).astype(np.int64) + self.columns // 2
+        cells, inverse = np.unique(rows * self.columns + columns, return_inverse=True)
+        cell_rows, cell_columns = np.divmod(cells, self.columns)
+        south = cell_rows * cell_degrees
+        west = (cell_columns - self.columns // 2) * cell_degrees
+        boxes = shapely.box(west, south, west + cell_degrees, south + cell_degrees)
+
+        # Cells inside a region settle all of their points
+        inside_cells, inside_regions = self.tree.query(boxes, predicate='within')
+        cell_regions = np.full(len(cells), -1, dtype=np.int32)
+        cell_regions[inside_cells] = inside_regions
+        found = cell_regions[inverse.ravel()]
+
+        # Points of border cells are tested against each region their cell touches; the first hit wins
+        edge_cells, edge_regions = self.tree.query(boxes, predicate='intersects')
+        edge = cell_regions[edge_cells] < 0
+        edge_cells, edge_regions = edge_cells[edge], edge_regions[edge]
+        pending = np.flatnonzero(found < 0)
+        pending_cells = inverse.ravel()[pending]
+        for region in np.unique(edge_regions):
+            candidates = pending[np.isin(pending_cells, edge_cells[edge_regions == region])]
+            candidates = candidates[found[candidates] < 0]
+            hits = shapely.intersects_xy(self.geometries[region], lon[candidates], lat[candidates])
+            found[candidates[hits]] = region
+
+        outside = np.flatnonzero(found < 0)
+        if len(outside) and snap_degrees:
+            points = shapely.points(lon[outside], lat[outside])
+            hits, nearest = self.tree.query_nearest(points, max_distance=snap_degrees, all_matches=False)
+            found[outside[hits]] = nearest
+
+        regions[valid] = found
+        return regions
+
+    # Name of the region each point falls in, as a categorical with NaN outside every region
+    def lookup(self, lat, lon):
+        return pd.Categorical.from_codes(self.assign(lat, lon), categories=self.names)
+
+
+# Build an index once per version of its GeoJSON file
+@functools.lru_cache(maxsize=4)
+def load_index(path, mtime, name_property='name'):
+    with open(path) as f:
+        return RegionIndex(json.load(f), name_property)
+
+
+def load_state_index():
+    return load_index(state_geojson_path, os.path.getmtime(state_geojson_path))
+
+
+# Time bulk assignment of jittered copies of the outlets and check it against a polygon test per state
+if __name__ == '__main__':
+    start = time.perf_counter()
+    index = load_state_index()
+    print(f"Indexed {len(index.names)} states in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    outlets = pd.read_csv('FastFoodRestaurants.csv', usecols=['latitude', 'longitude'])
+    rng = np.random.default_rng(0)
+    for copies in (1, 100):
+        lat = np.repeat(outlets['latitude'].to_numpy(), copies) + rng.normal(0, 0.05, len(outlets) * copies)
+        lon = np.repeat(outlets['longitude'].to_numpy(), copies) + rng.normal(0, 0.05, len(outlets) * copies)
+        start = time.perf_counter()
+        regions = index.assign(lat, lon)
+        print(f"Assigned {len(lat)} points in {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"{(regions < 0).sum()} without a state")
+
+    sample = rng.choice(len(lat), 20000, replace=False)
+    expected = np.full(len(sample), -1)
+    for region in range(len(index.names) - 1, -1, -1):
+        expected[shapely.intersects_xy(index.geometries[region], lon[sample], lat[sample])] = region
+    inside = expected >= 0
+    print("matches a polygon test per state:", np.array_equal(regions[sample][inside], expected[inside]))
@@ -0,0 +1,140 @@
+import functools
+import time
+
+import numpy as np
+
+import spatial_index
+
+# Average door-to-door speed of each commute mode of us_commuting_modes.csv (commute.color_schemes), in km/h,
+# including traffic, stops and waiting for connections
+mode_speeds_kmh = {
+    'Car': 40.0,
+    'Bike': 15.0,
+    'Public Transport': 20.0,
+    'Walking': 5.0,
+}
+
+# Streets and tracks are longer than the straight line; typical urban networks add about 30 %
+detour_factor = 1.3
+
+# Float64 entries computed per block of origins, bounding the temporaries of large matrices to ~32 MB
+block_entries = 4_000_000
+
+# Route plans kept for repeated queries
+route_cache_size = 1024
+
+
+# Points on the unit sphere, as an (n, 3) array
+def unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+# Great-circle distance in km from every origin to every destination, as a float32 (origins, destinations) matrix.
+# Gives spatial_index.haversine_km's distances through one matrix product of unit vectors per block of origins:
+# the chord between two points is sqrt(2 - 2 p·q), and the great-circle angle is 2 asin(chord / 2).
+def distance_matrix(origin_lat, origin_lon, destination_lat, destination_lon):
+    origins = unit_vectors(origin_lat, origin_lon)
+    destinations = np.ascontiguousarray(unit_vectors(destination_lat, destination_lon).T)
+    distances = np.empty((len(origins), destinations.shape[1]), dtype=np.float32)
+    rows = max(1, block_entries // max(1, destinations.shape[1]))
+    buffer = np.empty((min(rows, len(origins)), destinations.shape[1]))
+    for start in range(0, len(origins), rows):
+        block = origins[start:start + rows]
+        dot = np.matmul(block, destinations, out=buffer[:len(block)])
+        # 1 - p·q cancels for nearby points, so it is taken in float64; the rest only needs float32
+        np.clip(dot, -1.0, 1.0, out=dot)
+        np.subtract(1.0, dot, out=dot)
+        dot *= 0.5
+        out = distances[start:start + len(block)]
+        np.sqrt(dot, out=out, casting='same_kind')
+        np.arcsin(out, out=out)
+        out *= 2 * spatial_index.earth_radius_km
+    return distances
+
+
+# Travel time in minutes of straight-line distances, by commute mode
+def travel_minutes(distances_km, mode):
+    return np.asarray(distances_km) * (detour_factor * 60 / mode_speeds_kmh[mode])
+
+
+# Travel time in minutes from every origin to every destination, as a float32 (origins, destinations) matrix
+def travel_time_matrix(origin_lat, origin_lon, destination_lat, destination_lon, mode):
+    minutes = distance_matrix(origin_lat, origin_lon, destination_lat, destination_lon)
+    minutes *= detour_factor * 60 / mode_speeds_kmh[mode]
+    return minutes
+
+
+# Visiting order of the stops of a distance matrix, starting at stop 0: a nearest-neighbour tour improved by 2-opt.
+# Without return_to_start the route ends at whichever stop is best last.
+def order_stops(distances, return_to_start=False):
+    n = len(distances)
+    if n < 3:
+        return list(range(n))
+
+    route = [0]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[0] = False
+    for _ in range(n - 1):
+        row = np.where(unvisited, distances[route[-1]], np.inf)
+        route.append(int(np.argmin(row)))
+        unvisited[route[-1]] = False
+
+    # Close the tour at the start, or at a virtual stop n that is free to reach from anywhere,
+    # so both ends of every reversible segment have a fixed neighbour
+    padded = np.zeros((n + 1, n + 1))
+    padded[:n, :n] = distances
+    path = np.array(route + [0 if return_to_start else n])
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 2):
+            # Gain of reversing path[i..j], for every j at once
+            j = np.arange(i + 1, len(path) - 1)
+            a, b, c, e = path[i - 1], path[i], path[j], path[j + 1]
+            gain = padded[a, b] + padded[c, e] - padded[a, c] - padded[b, e]
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                path[i:j[best] + 1] = path[i:j[best] + 1][::-1]
+                improved = True
+    return [int(stop) for stop in path[:-1]]
+
+
+# Order in which to visit the stops from an origin, and the straight-line km of each leg, as tuples.
+# Travel time scales distance by a constant per mode, so the shortest order is also the quickest for every mode.
+# origin is a (lat, lon) pair and stops a tuple of them, which keeps repeated queries cacheable.
+@functools.lru_cache(maxsize=route_cache_size)
+def plan_route(origin, stops, return_to_start=False):
+    points = np.array((origin,) + tuple(stops), dtype=float).reshape(-1, 2)
+    distances = distance_matrix(points[:, 0], points[:, 1], points[:, 0], points[:, 1]).astype(float)
+    order = order_stops(distances, return_to_start)
+    path = order + [0] if return_to_start else order
+    legs = tuple(float(distances[a, b]) for a, b in zip(path, path[1:]))
+    return tuple(stop - 1 for stop in order[1:]), legs
+
+
+# Time bulk travel matrices and route ordering against the place table
+if __name__ == '__main__':
+    places = spatial_index.load_places()
+    lat, lon = places['latitude'].to_numpy(), places['longitude'].to_numpy()
+    rng = np.random.default_rng(0)
+    origins = rng.choice(len(places), 2000, replace=False)
+
+    start = time.perf_counter()
+    minutes = travel_time_matrix(lat[origins], lon[origins], lat, lon, 'Car')
+    print(f"{minutes.shape[0]} × {minutes.shape[1]} travel time matrix in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    sample = rng.choice(len(places), 1000, replace=False)
+    expected = spatial_index.haversine_km(lat[origins[:100], None], lon[origins[:100], None], lat[None, sample], lon[None, sample])
+    actual = distance_matrix(lat[origins[:100]], lon[origins[:100]], lat[sample], lon[sample])
+    print(f"largest difference from haversine_km: {np.abs(actual - expected).max() * 1000:.2f} m")
+
+    stops = tuple(zip(lat[origins[:25]], lon[origins[:25]]))
+    start = time.perf_counter()
+    order, legs = plan_route((34.0522, -118.2437), stops, True)
+    print(f"ordered {len(stops)} stops in {(time.perf_counter() - start) * 1000:.1f} ms: {sum(legs):.0f} km round trip")
+    start = time.perf_counter()
+    plan_route((34.0522, -118.2437), stops, True)
+    print(f"repeated query: {(time.perf_counter() - start) * 1e6:.0f} µs")
@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+import commute
+import data_prep
+import health
+
+# Default weight of each scored feature; a negative weight prefers states with lower values.
+# Features without an entry (for example a new cause of death) start at 0.
+default_weights = {
+    'Mean household income ($)': 1.0,
+    'Fast food outlets per 10k households': 0.0,
+    'Car commuters (%)': 0.0,
+    'Public transport commuters (%)': 0.25,
+    'Bike commuters (%)': 0.25,
+    'Walking commuters (%)': 0.25,
+    'Adult obesity (%)': -0.5,
+    'Diabetes death rate': -0.5,
+    'Heart disease death rate': -0.5,
+}
+
+
+# Raw per-state features, one row per state in `states` order; NaN where a source has no value
+def load_state_features(states, cubes=None, state_row_counts=None):
+    index = pd.Index(states)
+    income = columnar_cache.read_table(data_prep.income_csv_path, columns=['states', 'Total', 'Mean income (dollars)'])
+    income = income.drop_duplicates('states', keep='last').set_index('states').reindex(index).astype(float)
+    if state_row_counts is None:
+        state_row_counts = data_prep.load_state_row_counts()
+    counts = state_row_counts.drop_duplicates('state').set_index('state')['row_count']
+    commute_modes = commute.load_commute_modes().set_index('State').reindex(index).astype(float)
+    if cubes is None:
+        cubes = health.build_cubes(states)
+    death_rates = cubes['Age-adjusted death rate (per 100,000)']
+    obesity = cubes['Adult obesity (%)']
+
+    features = pd.DataFrame({
+        'Mean household income ($)': income['Mean income (dollars)'],
+        'Fast food outlets per 10k households': counts.reindex(index).fillna(0) / income['Total'] * 10000,
+        'Car commuters (%)': commute_modes['Car (%)'],
+        'Public transport commuters (%)': commute_modes['Public Transport (%)'],
+        'Bike commuters (%)': commute_modes['Bike (%)'],
+        'Walking commuters (%)': commute_modes['Walking (%)'],
+        # Average the stratifications (female, male) of the latest survey year
+        'Adult obesity (%)': pd.DataFrame(obesity.values[:, -1, :]).mean(axis=1).to_numpy(),
+    }, index=index)
+    for cause in death_rates.categories:
+        features[f'{cause} death rate'] = death_rates.slice(death_rates.years[-1], cause)
+    return features
+
+
+# Standardize every feature to z-scores; missing values score as the average state
+def normalize_features(features):
+    values = features.to_numpy(dtype=float)
+    with np.errstate(all='ignore'):
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0)
+    return np.nan_to_num((values - mean) / np.where(std > 0, std, 1))
+
+
+# Weighted score of every state: one matrix-vector product, scaled by the total absolute weight
+def score(normalized, weights):
+    weights = np.asarray(weights, dtype=float)
+    return normalized @ weights / (np.abs(weights).sum() or 1)
+
+
+# Time building the feature matrix and re-scoring it
+if __name__ == '__main__':
+    states = [feature['properties']['name'] for feature in data_prep.load_us_states()['features']]
+    start = time.perf_counter()
+    features = load_state_features(states)
+    normalized = normalize_features(features)
+    print(f"Built a {normalized.shape} feature matrix in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    weights = np.array([default_weights.get(name, 0.0) for name in features.columns])
+    start = time.perf_counter()
+    for _ in range(10000):
+        np.argsort(-score(normalized, weights))
+    print(f"score + rank: {(time.perf_counter() - start) * 100:.2f} µs")
+    print(pd.Series(score(normalized, weights), index=states).sort_values(ascending=False).head(10).round(2))
@@ -0,0 +1,180 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+
+# Mean Earth radius in kilometers
+earth_radius_km = 6371.0088
+
+# Kilometers per degree of latitude
+km_per_degree = math.pi * earth_radius_km / 180
+
+# Bulk queries against indexes with at most this many points use a dense distance matrix
+dense_query_points = 256
+
+
+# Great-circle distance in kilometers; broadcasts over array arguments
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# Grid index over latitude/longitude.
+# Points are sorted by grid cell so the points of each cell row are one contiguous slice.
+class PointIndex:
+    def __init__(self, lat, lon, cell_degrees=0.1):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.cell_degrees = cell_degrees
+        self.columns = int(math.ceil(360 / cell_degrees)) + 1
+        keys = self._cell_keys(self._cell(self.lat), self._cell(self.lon))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _cell(self, values):
+        return np.floor(np.asarray(values) / self.cell_degrees).astype(np.int64)
+
+    def _cell_keys(self, rows, columns):
+        return rows * self.columns + (columns + self.columns // 2)
+
+    # Indices of the points in the grid cells covering a circle of radius_km around (lat, lon)
+    def _candidates(self, lat, lon, radius_km):
+        lat_span = radius_km / km_per_degree
+        if abs(lat) + lat_span >= 90:
+            return np.arange(len(self))
+        lon_span = lat_span / math.cos(math.radians(abs(lat) + lat_span))
+        if lon_span >= 180:
+            return np.arange(len(self))
+
+        first_row, last_row = self._cell(lat - lat_span), self._cell(lat + lat_span)
+        first_column, last_column = self._cell(lon - lon_span), self._cell(lon + lon_span)
+        rows = np.arange(first_row, last_row + 1)
+        starts = np.searchsorted(self.keys, self._cell_keys(rows, first_column), side='left')
+        ends = np.searchsorted(self.keys, self._cell_keys(rows, last_column), side='right')
+        if not len(rows) or (ends - starts).sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+
+    # All points within radius_km of (lat, lon), nearest first, as (indices, distances)
+    def within(self, lat, lon, radius_km):
+        candidates = self._candidates(lat, lon, radius_km)
+        distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        keep = distances <= radius_km
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
+
+    # The k points nearest to (lat, lon), nearest first, as (indices, distances)
+    def nearest(self, lat, lon, k):
+        k = min(k, len(self))
+        radius_km = self.cell_degrees * km_per_degree
+        while True:
+            indices, distances = self.within(lat, lon, radius_km)
+            # Everything within radius_km has been seen, so k hits inside it are the true k nearest
+            if len(indices) >= k or radius_km > math.pi * earth_radius_km:
+                return indices[:k], distances[:k]
+            radius_km *= 2
+
+    # The k nearest points for many origins at once, as (indices, distances) arrays of shape (origins, k)
+    def nearest_many(self, lats, lons, k):
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        k = min(k, len(self))
+        if len(self) > dense_query_points:
+            # Grid queries only touch nearby cells, which beats a dense distance matrix for large point sets
+            indices = np.empty((len(lats), k), dtype=np.int64)
+            distances = np.empty((len(lats), k))
+            for row, (lat, lon) in enumerate(zip(lats, lons)):
+                indices[row], distances[row] = self.nearest(lat, lon, k)
+            return indices, distances
+
+        matrix = haversine_km(lats[:, None], lons[:, None], self.lat[None, :], self.lon[None, :])
+        part = np.argpartition(matrix, k - 1, axis=1)[:, :k]
+        part_distances = np.take_along_axis(matrix, part, axis=1)
+        order = np.argsort(part_distances, axis=1, kind='stable')
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_distances, order, axis=1)
+
+
+# Point datasets searched by the route planner, with the category each place is listed under
+place_sources = [
+    ('cal.csv', 'fast food'),
+    ('FastFoodRestaurants.csv', 'fast food'),
+    ('fitness_grocery.csv', None),
+]
+
+
+# Load every point dataset into one table of named, categorized places
+def load_places():
+    frames = []
+    for csv_path, category in place_sources:
+        data = columnar_cache.read_table(csv_path, columns=['name', 'address', 'latitude', 'longitude', 'state', 'Type'])
+        data = data.dropna(subset=['latitude', 'longitude'])
+        if category is None:
+            # fitness_grocery.csv labels rows "Fitness" or "Grocery/Organic Store"
+            types = data['Type'].astype(str).str.lower()
+            data['category'] = np.where(types.str.contains('grocery'), 'grocery', types)
+        else:
+            data['category'] = category
+        frames.append(data[['name', 'address', 'latitude', 'longitude', 'state', 'category']].astype(
+            {'name': str, 'address': str, 'latitude': float, 'longitude': float}
+        ))
+
+    # cal.csv and FastFoodRestaurants.csv overlap, so keep each named place once
+    places = pd.concat(frames, ignore_index=True)
+    places = places.drop_duplicates(subset=['name', 'latitude', 'longitude']).reset_index(drop=True)
+    places['state'] = places['state'].astype('category')
+    places['category'] = places['category'].astype('category')
+    return places
+
+
+# A spatial index per place category, so each category can be queried on its own
+def build_place_indexes(places):
+    return {
+        category: (group.reset_index(drop=True), PointIndex(group['latitude'], group['longitude']))
+        for category, group in places.groupby('category', observed=True)
+    }
+
+
+# The k nearest places of each category within radius_km of an origin, nearest first
+def nearby_places(place_indexes, lat, lon, k, radius_km, categories=None):
+    results = []
+    for category, (group, index) in place_indexes.items():
+        if categories is not None and category not in categories:
+            continue
+        indices, distances = index.nearest(lat, lon, k)
+        keep = distances <= radius_km
+        found = group.iloc[indices[keep]].copy()
+        found['distance_km'] = distances[keep]
+        results.append(found)
+    if not results:
+        return pd.DataFrame(columns=['name', 'address', 'latitude', 'longitude', 'state', 'category', 'distance_km'])
+    return pd.concat(results, ignore_index=True).sort_values('distance_km', ignore_index=True)
+
+
+# Time single and bulk queries against the full place table
+if __name__ == '__main__':
+    places = load_places()
+    start = time.perf_counter()
+    index = PointIndex(places['latitude'], places['longitude'])
+    print(f"Indexed {len(index)} places in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.nearest(34.0522, -118.2437, 10)
+    print(f"nearest(k=10): {(time.perf_counter() - start):.3f} ms per query")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.within(34.0522, -118.2437, 5)
+    print(f"within(5 km): {(time.perf_counter() - start):.3f} ms per query")
+
+    origins = places.sample(1000, random_state=0)
+    start = time.perf_counter()
+    index.nearest_many(origins['latitude'], origins['longitude'], 10)
+    print(f"nearest_many(1000 origins, k=10): {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,129 @@
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+import data_prep
+import density
+
+# Rows parsed per chunk; peak memory is one chunk plus the running aggregates
+chunk_rows = 200_000
+
+# Cell sizes (km) of the outlet density grids the app offers
+grid_cell_sizes = (10, 25, 50, 100)
+
+
+# One uint64 per coordinate pair: the float32 bit patterns of latitude and longitude,
+# which is the precision the cached tables keep and deduplicate on
+def coordinate_keys(lat, lon):
+    lat = np.ascontiguousarray(lat, dtype=np.float32) + np.float32(0)  # fold -0.0 into 0.0
+    lon = np.ascontiguousarray(lon, dtype=np.float32) + np.float32(0)
+    return (lat.view(np.uint32).astype(np.uint64) << np.uint64(32)) | lon.view(np.uint32).astype(np.uint64)
+
+
+# The coordinates seen so far, as one sorted array that each chunk is merged into.
+# 8 bytes per distinct coordinate, instead of the ~70 a Python set entry costs.
+class CoordinateSet:
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Mark the first occurrence of every key not seen before, and remember the new keys
+    def add(self, keys):
+        unique, first = np.unique(keys, return_index=True)
+        position = np.searchsorted(self.keys, unique)
+        seen = position < len(self.keys)
+        seen[seen] = self.keys[position[seen]] == unique[seen]
+        new = np.zeros(len(keys), dtype=bool)
+        new[first[~seen]] = True
+        self.keys = np.insert(self.keys, position[~seen], unique[~seen])
+        return new
+
+
+# Add sorted (keys, counts) pairs into a running total
+def merge_counts(total, keys, counts):
+    if total is None:
+        return keys, counts
+    merged_keys, index = np.unique(np.concatenate([total[0], keys]), return_inverse=True)
+    return merged_keys, np.bincount(index.ravel(), weights=np.concatenate([total[1], counts])).astype(np.int64)
+
+
+# Stream the outlet CSV in chunks and accumulate the aggregates the maps use:
+# the per-state counts of data_prep.count_outlets_by_state and the hex cell counts of density.load_outlet_points.
+# Like the in-memory path, the first row at each coordinate wins, rows with NA values are not counted per state,
+# and states count the points inside them.
+def aggregate_outlets(csv_path=data_prep.csv_path, cell_sizes=grid_cell_sizes, shape='hex', chunk_rows=chunk_rows):
+    # Production feeds share the layout of FastFoodRestaurants.csv, whatever the file is called
+    source = columnar_cache.sources[os.path.basename(data_prep.csv_path)]
+    seen = CoordinateSet()
+    state_counts = pd.Series(dtype='int64')
+    grids = dict.fromkeys(cell_sizes)
+    rows = 0
+    for chunk in pd.read_csv(csv_path, encoding=source['encoding'], chunksize=chunk_rows):
+        chunk = source['normalize'](chunk)
+        rows += len(chunk)
+        first = chunk.loc[seen.add(coordinate_keys(chunk['latitude'], chunk['longitude']))]
+
+        counts = first.dropna().groupby('state', observed=True).size()
+        state_counts = state_counts.add(counts.rename(index=str), fill_value=0).astype('int64')
+
+        located = first.dropna(subset=['latitude', 'longitude'])
+        for cell_km in cell_sizes:
+            keys, counts = np.unique(density.cell_keys(located['latitude'], located['longitude'], cell_km, shape),
+                                     return_counts=True)
+            grids[cell_km] = merge_counts(grids[cell_km], keys, counts)
+
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    return {
+        'rows': rows,
+        'coordinates': len(seen),
+        'state_row_counts': data_prep.state_counts_frame(state_counts.sort_index()),
+        'grids': {cell_km: grid if grid is not None else empty for cell_km, grid in grids.items()},
+    }
+
+
+# Check the streamed aggregates against the in-memory ones and report time and peak memory.
+# Pass --copies to stream a synthetic file of jittered copies of the outlets instead.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stream the outlet CSV into per-state and per-cell counts")
+    parser.add_argument('--copies', type=int, default=1, help="write and stream this many jittered copies")
+    parser.add_argument('--chunk-rows', type=int, default=chunk_rows)
+    args = parser.parse_args()
+
+    path = data_prep.csv_path
+    if args.copies > 1:
+        path = os.path.join(columnar_cache.cache_dir, f'FastFoodRestaurants-x{args.copies}.csv')
+        if not os.path.exists(path):
+            original = pd.read_csv(data_prep.csv_path)
+            rng = np.random.default_rng(0)
+            os.makedirs(columnar_cache.cache_dir, exist_ok=True)
+            for copy in range(args.copies):
+                jittered = original.copy()
+                if copy:
+                    jittered['latitude'] += rng.normal(0, 0.05, len(original))
+                    jittered['longitude'] += rng.normal(0, 0.05, len(original))
+                jittered.to_csv(path, mode='a', header=copy == 0, index=False)
+
+    start = time.perf_counter()
+    aggregates = aggregate_outlets(path, chunk_rows=args.chunk_rows)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Streamed {aggregates['rows']} rows ({aggregates['coordinates']} coordinates) "
+          f"in {elapsed:.2f} s, peak RSS {peak_mb:.0f} MB")
+
+    if args.copies == 1:
+        expected = data_prep.count_outlets_by_state(columnar_cache.read_table(path))
+        streamed = aggregates['state_row_counts']
+        print("state counts match:", expected.set_index('state')['row_count'].sort_index()
+              .equals(streamed.set_index('state')['row_count'].sort_index()))
+        lat, lon = density.load_outlet_points(path)
+        for cell_km, (keys, counts) in aggregates['grids'].items():
+            expected_keys, expected_counts = np.unique(density.cell_keys(lat, lon, cell_km), return_counts=True)
+            print(f"{cell_km} km cells match:",
+                  np.array_equal(keys, expected_keys) and np.array_equal(counts, expected_counts))
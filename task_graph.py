@@ -0,0 +1,79 @@
+import concurrent.futures
+import os
+import time
+
+import instrumentation
+
+
+# Run a dependency graph of tasks on a thread pool.
+# tasks maps a name to (fn, dependency names); fn is called with the dependencies' results, in order,
+# as soon as they are all available. Threads suit this work: CSV parsing, Parquet reads, shapely and
+# NumPy release the GIL, and results are shared without pickling. There is one worker per CPU by default;
+# more threads than cores only adds GIL contention. Returns the results and, per task, its start and
+# end in ms from the start of the run.
+def run_graph(tasks, max_workers=None):
+    for name, (_, dependencies) in tasks.items():
+        missing = [dependency for dependency in dependencies if dependency not in tasks]
+        if missing:
+            raise ValueError(f"Task {name!r} depends on unknown tasks {missing}")
+
+    results = {}
+    timings = {}
+    pending = dict(tasks)
+    running = {}
+    origin = time.perf_counter()
+
+    def run_task(name, fn, arguments):
+        start = time.perf_counter()
+        with instrumentation.span('prepare', name):
+            result = fn(*arguments)
+        timings[name] = {'start_ms': (start - origin) * 1000, 'end_ms': (time.perf_counter() - origin) * 1000}
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers or os.cpu_count()) as pool:
+        while pending or running:
+            ready = [name for name, (_, dependencies) in pending.items() if all(d in results for d in dependencies)]
+            for name in ready:
+                fn, dependencies = pending.pop(name)
+                running[pool.submit(run_task, name, fn, [results[d] for d in dependencies])] = name
+            if not running:
+                raise ValueError(f"Tasks {sorted(pending)} have a dependency cycle")
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+    return results, timings
+
+
+# The chain of dependent tasks with the largest total run time, as (names, total ms).
+# Wall time can not go below it however many workers there are.
+def critical_path(tasks, timings):
+    longest = {}
+
+    def chain(name):
+        if name not in longest:
+            duration = timings[name]['end_ms'] - timings[name]['start_ms']
+            previous = max((chain(dependency) for dependency in tasks[name][1]), key=lambda path: path[1], default=([], 0))
+            longest[name] = (previous[0] + [name], previous[1] + duration)
+        return longest[name]
+
+    return max((chain(name) for name in tasks), key=lambda path: path[1])
+
+
+# Text report of a run: each task's span, the total task time, the wall time and the critical path
+def report(tasks, timings):
+    lines = []
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]['start_ms']):
+        duration = timing['end_ms'] - timing['start_ms']
+        lines.append(f"{name:<32} {timing['start_ms']:>8.1f} → {timing['end_ms']:>8.1f} ms  ({duration:.1f} ms)")
+    total = sum(timing['end_ms'] - timing['start_ms'] for timing in timings.values())
+    wall = max(timing['end_ms'] for timing in timings.values())
+    path, path_ms = critical_path(tasks, timings)
+    lines.append(f"task time {total:.1f} ms, wall time {wall:.1f} ms")
+    lines.append(f"critical path {path_ms:.1f} ms: {' → '.join(path)}")
+    return '\n'.join(lines)
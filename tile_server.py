@@ -0,0 +1,183 @@
+import functools
+import http.server
+import io
+import math
+import os
+import re
+import threading
+import time
+import urllib.request
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import columnar_cache
+
+# Raster tiles are 256 px squares in the Web Mercator tiling Leaflet uses
+tile_size = 256
+
+# Rendered tiles kept in memory; the least recently used are evicted first
+tile_cache_size = 4096
+
+# Interface and port the tile endpoint listens on; only this machine can reach it by default
+tile_host = os.environ.get('TILE_HOST', '127.0.0.1')
+tile_port = int(os.environ.get('TILE_PORT', 8765))
+
+# Address browsers reach the endpoint on. Unset, it is the local endpoint, which only a browser
+# on the same machine can load; remote deployments set it to the endpoint's public (https) address.
+tile_url = os.environ.get('TILE_URL')
+local_tile_url = f'http://localhost:{tile_port}'
+
+# Body of the endpoint's health check, which tells it apart from other programs on the port
+health_text = b'point tiles'
+
+# Point layers served as tiles: source CSV, the column that picks a color, and the colors
+tile_layers = {
+    'cal': {'path': 'cal.csv', 'column': None, 'colors': {}, 'default_color': 'orange'},
+    'fitness_grocery': {
+        'path': 'fitness_grocery.csv',
+        'column': 'Type',
+        'colors': {'fitness': 'red', 'grocery/organic store': 'green'},
+        'default_color': 'blue',
+    },
+    'fast_food': {'path': 'FastFoodRestaurants.csv', 'column': None, 'colors': {}, 'default_color': 'orange'},
+}
+
+tile_path_pattern = re.compile(r'^/(\w+)/(\d+)/(\d+)/(\d+)\.png$')
+
+_server = None
+_lock = threading.Lock()
+
+
+# Web Mercator position of each point in zoom-0 pixels, a 256 × 256 square covering the world
+def world_pixels(lat, lon):
+    x = (np.asarray(lon, dtype=float) + 180) / 360 * tile_size
+    sin = np.sin(np.radians(np.clip(lat, -85.0511, 85.0511)))
+    y = (0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * tile_size
+    return x, y
+
+
+# A layer's points, sorted by x so the points of a tile column are one slice
+class TileIndex:
+    def __init__(self, lat, lon, colors):
+        x, y = world_pixels(lat, lon)
+        order = np.argsort(x, kind='stable')
+        self.x, self.y, self.colors = x[order], y[order], np.asarray(colors)[order]
+
+    # Points within a tile, padded by `pad` tile pixels so markers on the edge are drawn on both tiles
+    def in_tile(self, z, x, y, pad):
+        scale = 2 ** z
+        left, right = (x * tile_size - pad) / scale, ((x + 1) * tile_size + pad) / scale
+        top, bottom = (y * tile_size - pad) / scale, ((y + 1) * tile_size + pad) / scale
+        start, end = np.searchsorted(self.x, [left, right])
+        inside = (self.y[start:end] >= top) & (self.y[start:end] <= bottom)
+        return (
+            self.x[start:end][inside] * scale - x * tile_size,
+            self.y[start:end][inside] * scale - y * tile_size,
+            self.colors[start:end][inside],
+        )
+
+
+# Load a layer once per version of its source file
+@functools.lru_cache(maxsize=len(tile_layers) * 2)
+def load_layer(name, mtime):
+    spec = tile_layers[name]
+    columns = ['latitude', 'longitude'] + ([spec['column']] if spec['column'] else [])
+    data = columnar_cache.read_table(spec['path'], columns=columns).dropna(subset=['latitude', 'longitude'])
+    if spec['column']:
+        groups = data[spec['column']].astype(str).str.lower()
+        colors = groups.map(spec['colors']).fillna(spec['default_color']).to_numpy()
+    else:
+        colors = np.full(len(data), spec['default_color'])
+    return TileIndex(data['latitude'], data['longitude'], colors)
+
+
+# Marker radius in pixels: small dots when zoomed out, larger ones close up
+def marker_radius(z):
+    return max(1.5, min(6.0, z / 2 - 1))
+
+
+# PNG bytes of one tile; the source mtime is part of the key, so edited sources never serve stale tiles
+@functools.lru_cache(maxsize=tile_cache_size)
+def render_tile(name, mtime, z, x, y):
+    radius = marker_radius(z)
+    px, py, colors = load_layer(name, mtime).in_tile(z, x, y, pad=radius + 1)
+    image = Image.new('RGBA', (tile_size, tile_size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for cx, cy, color in zip(px, py, colors):
+        draw.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), fill=color, outline='white')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def tile(name, z, x, y):
+    return render_tile(name, os.path.getmtime(tile_layers[name]['path']), z, x, y)
+
+
+# Leaflet URL template of a layer's tiles
+def tile_url_template(name):
+    return f"{tile_url or local_tile_url}/{name}/{{z}}/{{x}}/{{y}}.png"
+
+
+class TileHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(health_text)))
+            self.end_headers()
+            self.wfile.write(health_text)
+            return
+        match = tile_path_pattern.match(self.path.split('?')[0])
+        if match is None or match.group(1) not in tile_layers:
+            self.send_error(404)
+            return
+        name, (z, x, y) = match.group(1), map(int, match.groups()[1:])
+        if z > 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            self.send_error(404)
+            return
+        body = tile(name, z, x, y)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'public, max-age=3600')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Whether a tile endpoint already answers on the port, such as the sidecar or another replica's thread
+def endpoint_running(host=tile_host, port=tile_port):
+    try:
+        with urllib.request.urlopen(f'http://{host}:{port}/health', timeout=1) as response:
+            return response.read() == health_text
+    except OSError:
+        return False
+
+
+# Serve tiles on a background thread, once per process. Returns whether tiles are served on the port,
+# by this process or by a tile endpoint already holding it; False when another program holds the port.
+def start_tile_server(host=tile_host, port=tile_port):
+    global _server
+    with _lock:
+        if _server is None:
+            try:
+                _server = http.server.ThreadingHTTPServer((host, int(port)), TileHandler)
+                threading.Thread(target=_server.serve_forever, daemon=True).start()
+            except OSError:
+                _server = False
+        return bool(_server) or endpoint_running(host, port)
+
+
+# Run as a sidecar: `python tile_server.py` serves the tiles until interrupted
+if __name__ == '__main__':
+    start = time.perf_counter()
+    for name in tile_layers:
+        tile(name, 4, 2, 6)
+    print(f"Loaded {len(tile_layers)} layers in {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(f"Serving {tile_url_template('<layer>')} for layers: {', '.join(tile_layers)}")
+    http.server.ThreadingHTTPServer((tile_host, tile_port), TileHandler).serve_forever()